@@ -0,0 +1,71 @@
+"""
+Deterministic synthetic corpora for the benchmarks.
+
+Every generator takes a random.Random and a scale factor and returns a
+(text1, text2) pair; the same seed and scale always produce the same texts.
+"""
+import random
+
+WORDS = ("the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "lorem", "ipsum",
+         "dolor", "sit", "amet", "value", "return", "self", "index", "buffer", "line", "merge")
+UNICODE_WORDS = ("naïve", "café", "Straße", "日本語", "テキスト", "中文字符", "한국어", "Ελληνικά",
+                 "русский", "עברית", "العربية", "emoji😀", "🚀🚀", "façade", "Ünïcödé")
+
+def _line(rng, words, count=10):
+    return " ".join(rng.choice(words) for _ in range(count)) + "\n"
+
+def _edit_lines(rng, lines, fraction, words):
+    """Returns a copy of lines with about fraction of them changed, inserted or deleted."""
+    edited = []
+    for line in lines:
+        roll = rng.random()
+        if roll >= fraction:
+            edited.append(line)
+        elif roll < fraction / 3:
+            continue
+        elif roll < 2 * fraction / 3:
+            edited.append(line)
+            edited.append(_line(rng, words))
+        else:
+            cut = rng.randrange(len(line))
+            edited.append(line[:cut] + rng.choice(words) + line[cut:])
+    return edited
+
+def small_edits(rng, scale):
+    """A large file with a handful of scattered one-word edits."""
+    lines = [_line(rng, WORDS) for _ in range(int(20_000 * scale))]
+    edited = list(lines)
+    for _ in range(20):
+        k = rng.randrange(len(edited))
+        edited[k] = edited[k].replace(" ", " edited ", 1)
+    return "".join(lines), "".join(edited)
+
+def heavy_rewrite(rng, scale):
+    """A medium file where about a third of the lines changed."""
+    lines = [_line(rng, WORDS) for _ in range(int(2_000 * scale))]
+    return "".join(lines), "".join(_edit_lines(rng, lines, 0.35, WORDS))
+
+def long_line(rng, scale):
+    """A single line without newlines, with small edits along it."""
+    text = "".join(rng.choice(WORDS) + " " for _ in range(int(4_000 * scale)))
+    edited = text
+    for _ in range(10):
+        cut = rng.randrange(len(edited))
+        edited = edited[:cut] + "XYZ" + edited[cut + 3:]
+    return text, edited
+
+def unicode_heavy(rng, scale):
+    """Multi-byte and astral-plane text with moderate edits."""
+    lines = [_line(rng, UNICODE_WORDS) for _ in range(int(5_000 * scale))]
+    return "".join(lines), "".join(_edit_lines(rng, lines, 0.05, UNICODE_WORDS))
+
+CORPORA = {
+    "small_edits": small_edits,
+    "heavy_rewrite": heavy_rewrite,
+    "long_line": long_line,
+    "unicode_heavy": unicode_heavy,
+}
+
+def generate(name, scale=1.0, seed=0):
+    """Generates one corpus by name."""
+    return CORPORA[name](random.Random(f"{name}:{seed}"), scale)
@@ -0,0 +1,259 @@
+"""
+Benchmarks for diffing, rendering, merging and file loading.
+
+    python benchmarks/run.py [--scale 1.0] [--repeat 5] [--only PATTERN]
+                             [--output results.json] [--baseline PATH]
+                             [--threshold 0.25] [--save-baseline]
+
+Each benchmark runs on the synthetic corpora from corpora.py. Results are
+printed and optionally written as JSON. If a baseline file exists (by
+default benchmarks/baseline.json), every result is compared against it and
+the run exits with status 1 when one is slower by more than the threshold.
+Baselines are machine specific: regenerate one with --save-baseline before
+measuring a change on a new machine.
+
+Rendering is timed by running DiffViewer's tag translation against stub
+widgets, so no display is needed. Without customtkinter installed,
+DiffViewer is built on a stand-in base class, which the rendering path
+never touches, so render results are recorded everywhere.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from character_differ import get_character_diffs, get_file_diffs  # noqa: E402
+from file_loader import MappedFile, read_text  # noqa: E402
+from line_index import LineIndex  # noqa: E402
+from merge_session import MergeSession  # noqa: E402
+from opcode_model import OpcodeModel  # noqa: E402
+
+import corpora  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+class _StubText:
+    """Stands in for a CTkTextbox: shows every line and counts tag operations."""
+
+    def __init__(self, line_index):
+        self.line_index = line_index
+        self.tagged = 0
+
+    def index(self, index):
+        return "1.0" if index == "@0,0" else f"{len(self.line_index)}.0"
+
+    def winfo_height(self):
+        return 1000
+
+    def winfo_rooty(self):
+        return 0
+
+    def winfo_children(self):
+        return []
+
+    def dlineinfo(self, index):
+        return (0, 0, 0, 15, 0)
+
+    def tag_remove(self, *args):
+        pass
+
+    def tag_add(self, *args):
+        self.tagged += 1
+
+class _StubCanvas:
+    """Stands in for the merge gutter canvas."""
+
+    def __init__(self):
+        self._items = 0
+
+    def winfo_rooty(self):
+        return 0
+
+    def create_text(self, *args, **kwargs):
+        self._items += 1
+        return self._items
+
+def _import_diff_viewer():
+    """Imports diff_viewer, standing in for customtkinter if it is not installed."""
+    try:
+        import customtkinter  # noqa: F401
+    except ImportError:
+        # Only the class statements of diff_viewer and ui_components need
+        # customtkinter; _stub_viewer() bypasses __init__.
+        sys.modules["customtkinter"] = types.SimpleNamespace(CTkFrame=object, CTkToplevel=object)
+        try:
+            import diff_viewer
+        finally:
+            del sys.modules["customtkinter"]
+        return diff_viewer.DiffViewer
+    from diff_viewer import DiffViewer
+    return DiffViewer
+
+def _stub_viewer(opcodes):
+    """Builds a DiffViewer that renders the whole document into stub widgets."""
+    DiffViewer = _import_diff_viewer()
+    viewer = DiffViewer.__new__(DiffViewer)
+    viewer.windowed = False
+    viewer.opcodes = OpcodeModel(opcodes)
+    viewer.merge_gutter = _StubCanvas()
+    viewer.font = None
+    viewer._gutter_items = {}
+    return viewer
+
+def _time(setup, run, repeat):
+    """Times run(setup()) repeat times, excluding setup; returns min and median seconds."""
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+def _benchmarks(name, text1, text2, opcodes, directory):
+    """Yields (benchmark_name, setup, run) for one corpus."""
+    path1, path2 = os.path.join(directory, f"{name}.1.txt"), os.path.join(directory, f"{name}.2.txt")
+    for path, text in ((path1, text1), (path2, text2)):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+
+    yield (f"diff.{name}", lambda: None,
+           lambda _: get_character_diffs(text1, text2, hierarchical=True))
+
+    def render_setup():
+        viewer = _stub_viewer(opcodes)
+        index1, index2 = LineIndex.from_text(text1), LineIndex.from_text(text2)
+        return viewer, (_StubText(index1), index1), (_StubText(index2), index2)
+
+    def render_run(state):
+        viewer, (widget1, index1), (widget2, index2) = state
+        viewer._render_side(1, widget1, index1)
+        viewer._render_side(2, widget2, index2)
+
+    yield f"render.{name}", render_setup, render_run
+
+    def merge_setup():
+        model = OpcodeModel(opcodes)
+        return MergeSession(path1, path2, text1, text2, model), range(len(model))
+
+    def merge_run(state):
+        session, indices = state
+        for op_idx in indices:
+            session.merge(op_idx, 'to_right')
+
+    yield f"merge.{name}", merge_setup, merge_run
+
+    def index_lines(_):
+        with MappedFile(path1) as mapped:
+            mapped.line_count
+
+    yield f"load.read_text.{name}", lambda: None, lambda _: read_text(path1)
+    yield f"load.line_index.{name}", lambda: None, index_lines
+    yield f"load.file_diff.{name}", lambda: None, lambda _: get_file_diffs(path1, path2)
+
+def run_benchmarks(scale=1.0, repeat=5, only=None, seed=0, log=print):
+    """
+    Runs every benchmark whose name matches the glob pattern only.
+
+    Returns:
+        A dict of benchmark name to timing results; skipped benchmarks map
+        to {"skipped": reason}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in corpora.CORPORA:
+            text1, text2 = corpora.generate(name, scale, seed)
+            opcodes = get_character_diffs(text1, text2, hierarchical=True, compact=True)
+            for bench_name, setup, run in _benchmarks(name, text1, text2, opcodes, directory):
+                if only and not fnmatch.fnmatch(bench_name, only):
+                    continue
+                try:
+                    results[bench_name] = _time(setup, run, repeat)
+                except ImportError as e:
+                    results[bench_name] = {"skipped": str(e)}
+                log(_format_result(bench_name, results[bench_name]))
+    return results
+
+def _format_result(name, result):
+    if "skipped" in result:
+        return f"{name:40} skipped ({result['skipped']})"
+    line = f"{name:40} min {result['min'] * 1000:10.2f} ms   median {result['median'] * 1000:10.2f} ms"
+    if "ratio" in result:
+        line += f"   x{result['ratio']:.2f} vs baseline"
+    return line
+
+def compare(results, baseline, threshold):
+    """
+    Annotates results with their ratio to the baseline minimum.
+
+    Returns:
+        The names of benchmarks that are slower than the baseline by more
+        than threshold (a fraction, e.g. 0.25 for 25%).
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if "min" not in result or not base or not base.get("min"):
+            continue
+        result["baseline_min"] = base["min"]
+        result["ratio"] = result["min"] / base["min"]
+        if result["ratio"] > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the DiffNote benchmarks.")
+    parser.add_argument("--scale", type=float, default=1.0, help="corpus size multiplier")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="glob pattern selecting benchmarks, e.g. 'diff.*'")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    document = {
+        "meta": {
+            "scale": args.scale,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": run_benchmarks(args.scale, args.repeat, args.only, args.seed),
+    }
+
+    status = 0
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("scale") != args.scale or baseline["meta"].get("seed") != args.seed:
+            print("Baseline was recorded with a different scale or seed; not comparing.")
+        else:
+            regressions = compare(document["results"], baseline["results"], args.threshold)
+            print()
+            for name in document["results"]:
+                if "ratio" in document["results"][name]:
+                    print(_format_result(name, document["results"][name]))
+            if regressions:
+                print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+                status = 1
+
+    for path in filter(None, (args.output, args.baseline if args.save_baseline else None)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+            f.write("\n")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
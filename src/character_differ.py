@@ -1,15 +1,340 @@
-import difflib
+from collections import namedtuple
+from itertools import accumulate
 
-def get_character_diffs(text1, text2):
+from diff_engines import (DEFAULT_ENGINE, _common_prefix, _common_suffix, get_engine, myers_matching_blocks,
+                          opcodes_from_blocks)
+from file_loader import MappedFile
+from opcode_array import OpcodeArray
+from perf_trace import traced
+
+# Lines decoded at a time when confirming that hash-equal line runs really match.
+VERIFY_CHUNK_LINES = 4096
+# Largest product of the two lengths, in characters, of a changed hunk that
+# is refined exhaustively with the chosen engine. Bigger hunks get one try
+# with the cost-bounded Myers search, which gives up after this many
+# checkpoints, and otherwise stay a single 'replace'.
+REFINE_MAX_PRODUCT = 4_000_000
+REFINE_MAX_STEPS = 1000
+
+class DiffCancelled(Exception):
+    """Raised from a progress callback to abort a running diff."""
+
+class _RefineBudgetExceeded(Exception):
+    """Raised inside _refine() when a large hunk takes more than REFINE_MAX_STEPS checkpoints."""
+
+# Result of get_three_way_merge(): the two merged texts, the opcodes between
+# them (equal everywhere except at conflicts), and the number of hunks that
+# were applied automatically and of conflicts left for the user.
+ThreeWayMerge = namedtuple("ThreeWayMerge", "text1 text2 opcodes applied conflicts")
+
+@traced("character_differ.get_character_diffs", "diff")
+def get_character_diffs(text1, text2, engine=DEFAULT_ENGINE, hierarchical=False, progress=None, compact=False):
     """
     Performs a character-level diff between two strings.
 
     Args:
         text1: The first string.
         text2: The second string.
+        engine: Name of the diff engine to use ("myers", "patience",
+            "histogram" or "difflib").
+        hierarchical: If True, diff lines first and only refine changed
+            hunks character by character (see get_hierarchical_diffs).
+        progress: Optional callable taking (done, total). It is called
+            periodically and may raise DiffCancelled to abort the diff.
+        compact: If True, return an OpcodeArray instead of a list.
+
+    Returns:
+        A list of (tag, i1, i2, j1, j2) opcodes, in the same format as
+        difflib.SequenceMatcher.get_opcodes().
+    """
+    if hierarchical:
+        opcodes = get_hierarchical_diffs(text1, text2, engine, progress)
+    else:
+        total = len(text1) + len(text2)
+        checkpoint = (lambda: progress(0, total)) if progress else None
+        blocks = get_engine(engine)(text1, text2, checkpoint)
+        opcodes = opcodes_from_blocks(blocks, len(text1), len(text2))
+    return OpcodeArray.from_opcodes(opcodes) if compact else opcodes
+
+def get_hierarchical_diffs(text1, text2, engine=DEFAULT_ENGINE, progress=None):
+    """
+    Performs a two-phase diff: line-level first, character-level inside changed hunks.
+
+    The common prefix and suffix are stripped back to line boundaries, the
+    remaining lines are hashed and diffed as sequences, and only replaced
+    line hunks are refined character by character. For typical edits the
+    cost follows the size of the change rather than the size of the files;
+    hunks too costly to refine (see _refine()) are kept as a single
+    'replace'.
+
+    Args:
+        text1: The first string.
+        text2: The second string.
+        engine: Name of the diff engine used for both phases.
+        progress: Optional callable taking (done, total) in characters of
+            the changed region; it may raise DiffCancelled.
+
+    Returns:
+        A list of (tag, i1, i2, j1, j2) character opcodes, in the same
+        format as get_character_diffs().
+    """
+    diff = get_engine(engine)
+    len1, len2 = len(text1), len(text2)
+
+    # Strip the common prefix and suffix, backing off to whole lines so the
+    # line phase never sees a partial line.
+    start = _common_prefix(text1, 0, len1, text2, 0, len2)
+    start = text1.rfind('\n', 0, start) + 1
+    tail = _common_suffix(text1, start, len1, text2, start, len2)
+    end1 = len1 - tail
+    if end1 > start:
+        cut = text1.find('\n', end1, len1)
+        end1 = cut + 1 if cut != -1 else len1
+    tail = len1 - end1
+    end2 = len2 - tail
+
+    total = (end1 - start) + (end2 - start)
+    done = 0
+    checkpoint = (lambda: progress(done, total)) if progress else None
+
+    lines1 = _split_lines(text1, start, end1)
+    lines2 = _split_lines(text2, start, end2)
+    # Lines are compared as whole strings; their cached hashes make equality
+    # checks and the patience/histogram lookups cheap.
+    line_opcodes = opcodes_from_blocks(diff(lines1, lines2, checkpoint), len(lines1), len(lines2))
+
+    offsets1 = _line_offsets(lines1, start)
+    offsets2 = _line_offsets(lines2, start)
+
+    opcodes = []
+    if start:
+        opcodes.append(('equal', 0, start, 0, start))
+    for tag, a1, a2, b1, b2 in line_opcodes:
+        i1, i2 = offsets1[a1], offsets1[a2]
+        j1, j2 = offsets2[b1], offsets2[b2]
+        if tag == 'replace':
+            refined = _refine(diff, text1[i1:i2], text2[j1:j2], checkpoint)
+            for sub_tag, si1, si2, sj1, sj2 in refined:
+                _append_opcode(opcodes, sub_tag, i1 + si1, i1 + si2, j1 + sj1, j1 + sj2)
+        else:
+            _append_opcode(opcodes, tag, i1, i2, j1, j2)
+        done += (i2 - i1) + (j2 - j1)
+        if progress:
+            progress(done, total)
+    if tail:
+        _append_opcode(opcodes, 'equal', end1, len1, end2, len2)
+    return opcodes
+
+@traced("character_differ.get_file_diffs", "diff")
+def get_file_diffs(path1, path2, engine=DEFAULT_ENGINE, progress=None, encoding='utf-8', compact=False):
+    """
+    Performs a hierarchical diff of two files without reading them into memory.
+
+    Line hashes are computed straight from memory-mapped buffers and diffed
+    as sequences. Hash-equal runs are confirmed chunk by chunk, and only the
+    changed hunks are decoded and refined character by character (within
+    the limits of _refine()), so memory stays bounded by the size of the
+    largest hunk.
+
+    Args:
+        path1: Path of the first file.
+        path2: Path of the second file.
+        engine: Name of the diff engine used for both phases.
+        progress: Optional callable taking (done, total) in lines; it may
+            raise DiffCancelled.
+        encoding: Text encoding of both files.
+        compact: If True, return an OpcodeArray instead of a list.
 
     Returns:
-        A list of opcodes from difflib.SequenceMatcher.
+        A list of (tag, i1, i2, j1, j2) character opcodes for the decoded
+        texts, as get_character_diffs() would return them.
     """
-    s = difflib.SequenceMatcher(None, text1, text2)
-    return s.get_opcodes()
+    diff = get_engine(engine)
+    with MappedFile(path1, encoding) as file1, MappedFile(path2, encoding) as file2:
+        total = file1.line_count + file2.line_count
+        done = 0
+        checkpoint = (lambda: progress(done, total)) if progress else None
+
+        keys1 = file1.line_keys(checkpoint)
+        keys2 = file2.line_keys(checkpoint)
+        line_opcodes = opcodes_from_blocks(diff(keys1, keys2, checkpoint), len(keys1), len(keys2))
+
+        opcodes = []
+        i = j = 0
+        for tag, a1, a2, b1, b2 in line_opcodes:
+            if tag == 'equal':
+                size = _confirmed_equal_length(file1, a1, a2, file2, b1, b2)
+                if size is not None:
+                    _append_opcode(opcodes, 'equal', i, i + size, j, j + size)
+                    i += size
+                    j += size
+                    done += (a2 - a1) + (b2 - b1)
+                    continue
+                tag = 'replace'  # A hash collision; let the character phase sort it out.
+
+            sub1, sub2 = file1.text(a1, a2), file2.text(b1, b2)
+            if tag == 'replace':
+                refined = _refine(diff, sub1, sub2, checkpoint)
+                for sub_tag, si1, si2, sj1, sj2 in refined:
+                    _append_opcode(opcodes, sub_tag, i + si1, i + si2, j + sj1, j + sj2)
+            else:
+                _append_opcode(opcodes, tag, i, i + len(sub1), j, j + len(sub2))
+            i += len(sub1)
+            j += len(sub2)
+            done += (a2 - a1) + (b2 - b1)
+            if progress:
+                progress(done, total)
+    return OpcodeArray.from_opcodes(opcodes) if compact else opcodes
+
+@traced("character_differ.get_three_way_merge", "diff")
+def get_three_way_merge(base, left, right, engine=DEFAULT_ENGINE, progress=None):
+    """
+    Merges two texts that were both edited from a common ancestor.
+
+    base is diffed line by line against left and against right, once each,
+    and the two hunk streams are merged in a single pass over the base
+    lines. A region changed on one side only takes that side's lines; a
+    region changed identically on both sides is taken once. Regions where
+    both sides changed overlapping or adjacent base lines differently are
+    conflicts.
+
+    Args:
+        base: The common ancestor.
+        left: The first edited version.
+        right: The second edited version.
+        engine: Name of the diff engine.
+        progress: Optional callable taking (done, total) in base lines; it
+            may raise DiffCancelled.
+
+    Returns:
+        A ThreeWayMerge. Both of its texts contain every non-conflicting
+        change; at conflicts, text1 has the left version and text2 the right
+        one. Its opcodes (between text1 and text2) are refined character by
+        character inside conflicts and 'equal' elsewhere, so the comparison
+        view shows only the conflicts.
+    """
+    diff = get_engine(engine)
+    base_lines = _split_lines(base, 0, len(base))
+    left_lines = _split_lines(left, 0, len(left))
+    right_lines = _split_lines(right, 0, len(right))
+    total = len(base_lines)
+    checkpoint = (lambda: progress(0, total)) if progress else None
+
+    hunks = []
+    for side, lines in ((1, left_lines), (2, right_lines)):
+        line_opcodes = opcodes_from_blocks(diff(base_lines, lines, checkpoint), len(base_lines), len(lines))
+        hunks.extend((b1, b2, side, s1, s2) for tag, b1, b2, s1, s2 in line_opcodes if tag != 'equal')
+    # Sorting keeps each side's hunks in order and interleaves the two streams by base position.
+    hunks.sort()
+
+    pieces1, pieces2 = [], []
+    opcodes = []
+    position1 = position2 = 0
+    applied = conflicts = 0
+    base_done = 0
+    sources = {1: left_lines, 2: right_lines}
+
+    def emit_equal(text):
+        nonlocal position1, position2
+        if text:
+            pieces1.append(text)
+            pieces2.append(text)
+            _append_opcode(opcodes, 'equal', position1, position1 + len(text),
+                           position2, position2 + len(text))
+            position1 += len(text)
+            position2 += len(text)
+
+    k = 0
+    while k < len(hunks):
+        start, end = hunks[k][0], hunks[k][1]
+        region = [hunks[k]]
+        k += 1
+        # Grow the region while the next hunk (from either side) overlaps or touches it.
+        while k < len(hunks) and hunks[k][0] <= end:
+            end = max(end, hunks[k][1])
+            region.append(hunks[k])
+            k += 1
+
+        emit_equal("".join(base_lines[base_done:start]))
+        versions = {}
+        for side in (1, 2):
+            side_hunks = [hunk for hunk in region if hunk[2] == side]
+            if not side_hunks:
+                continue
+            first, last = side_hunks[0], side_hunks[-1]
+            side_start = first[3] - (first[0] - start)
+            side_end = last[4] + (end - last[1])
+            versions[side] = "".join(sources[side][side_start:side_end])
+
+        if len(versions) == 1 or versions[1] == versions[2]:
+            emit_equal(next(iter(versions.values())))
+            applied += 1
+        else:
+            conflicts += 1
+            text1, text2 = versions[1], versions[2]
+            pieces1.append(text1)
+            pieces2.append(text2)
+            refined = _refine(diff, text1, text2, checkpoint)
+            for tag, i1, i2, j1, j2 in refined:
+                _append_opcode(opcodes, tag, position1 + i1, position1 + i2, position2 + j1, position2 + j2)
+            position1 += len(text1)
+            position2 += len(text2)
+        base_done = end
+        if progress:
+            progress(base_done, total)
+    emit_equal("".join(base_lines[base_done:]))
+    return ThreeWayMerge("".join(pieces1), "".join(pieces2), opcodes, applied, conflicts)
+
+def _refine(diff, text1, text2, checkpoint):
+    """
+    Returns the character opcodes of a changed hunk.
+
+    Hunks within REFINE_MAX_PRODUCT are diffed with the chosen engine.
+    Larger ones, such as a long line with a few edits, are diffed with
+    Myers, whose checkpoints come at a bounded amount of work each, and
+    left as one 'replace' if that takes more than REFINE_MAX_STEPS of them.
+    """
+    if len(text1) * len(text2) <= REFINE_MAX_PRODUCT:
+        return opcodes_from_blocks(diff(text1, text2, checkpoint), len(text1), len(text2))
+    steps = 0
+
+    def budget():
+        nonlocal steps
+        steps += 1
+        if steps > REFINE_MAX_STEPS:
+            raise _RefineBudgetExceeded
+        if checkpoint:
+            checkpoint()
+
+    try:
+        blocks = myers_matching_blocks(text1, text2, budget)
+    except _RefineBudgetExceeded:
+        return [('replace', 0, len(text1), 0, len(text2))]
+    return opcodes_from_blocks(blocks, len(text1), len(text2))
+
+def _confirmed_equal_length(file1, a1, a2, file2, b1, b2):
+    """Returns the character length of two line runs if their text matches, else None."""
+    size = 0
+    for offset in range(0, a2 - a1, VERIFY_CHUNK_LINES):
+        count = min(VERIFY_CHUNK_LINES, a2 - a1 - offset)
+        chunk1 = file1.text(a1 + offset, a1 + offset + count)
+        if chunk1 != file2.text(b1 + offset, b1 + offset + count):
+            return None
+        size += len(chunk1)
+    return size
+
+def _split_lines(text, start, end):
+    """Splits text[start:end] into lines, keeping the line terminators."""
+    return text[start:end].splitlines(keepends=True)
+
+def _line_offsets(lines, start):
+    """Returns the absolute character offset of each line, plus the end offset."""
+    return list(accumulate(map(len, lines), initial=start))
+
+def _append_opcode(opcodes, tag, i1, i2, j1, j2):
+    """Appends an opcode, merging it into the previous one when both have the same tag."""
+    if opcodes and opcodes[-1][0] == tag:
+        _, pi1, _, pj1, _ = opcodes[-1]
+        opcodes[-1] = (tag, pi1, i2, pj1, j2)
+    else:
+        opcodes.append((tag, i1, i2, j1, j2))
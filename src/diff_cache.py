@@ -0,0 +1,152 @@
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+from opcode_array import PACK_FORMAT_VERSION, OpcodeArray
+
+# Bump when the diff output for the same inputs changes.
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_BYTES = 512 * 1024 * 1024
+
+def user_cache_dir(app_name="DiffNote"):
+    """Returns the per-user cache directory for the application, following platform conventions."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+        return os.path.join(base, app_name, "Cache")
+    if sys.platform == "darwin":
+        return os.path.join(os.path.expanduser("~/Library/Caches"), app_name)
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, app_name.lower())
+
+def text_digest(text):
+    """Returns a content digest of a string."""
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass')).digest()
+
+class DiffCache:
+    """
+    Caches diff results by the content digests of both inputs and the diff options.
+
+    Results live in an in-memory LRU bounded by a byte budget, stored in the
+    packed form of OpcodeArray.to_bytes(). If a directory is given, they are also
+    written there as binary files, and the oldest files are removed when the
+    directory exceeds its own budget.
+
+    Keys hash the inputs in full and put() writes to disk, so both are
+    meant to be called from worker threads; the cache is thread-safe.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, directory=None, max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def key(self, digest1, digest2, **options):
+        """Builds a cache key from two content digests and the diff options."""
+        key = hashlib.blake2b(digest_size=20)
+        key.update(struct.pack("<BB", CACHE_FORMAT_VERSION, PACK_FORMAT_VERSION))
+        key.update(digest1)
+        key.update(digest2)
+        key.update(repr(sorted(options.items())).encode())
+        return key.hexdigest()
+
+    def text_key(self, text1, text2, **options):
+        return self.key(text_digest(text1), text_digest(text2), **options)
+
+    def get(self, key):
+        """Returns the cached opcodes for key as an OpcodeArray, or None."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        if data is None:
+            data = self._read_disk(key)
+            if data is None:
+                return None
+            self._remember(key, data)
+        try:
+            return OpcodeArray.from_bytes(data)
+        except ValueError:
+            self.discard(key)
+            return None
+
+    def put(self, key, opcodes):
+        """Stores opcodes under key, in memory and, if enabled, on disk."""
+        data = OpcodeArray.from_opcodes(opcodes).to_bytes()
+        self._remember(key, data)
+        self._write_disk(key, data)
+
+    def discard(self, key):
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._size -= len(data)
+        if self.directory:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Touch the file so disk eviction is least-recently-used as well.
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.directory or len(data) > self.max_disk_bytes:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))
+            self._trim_disk()
+        except OSError:
+            # The disk cache is an optimization; failing to write it is not an error.
+            pass
+
+    def _trim_disk(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".bin"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
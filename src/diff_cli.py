@@ -0,0 +1,277 @@
+"""
+Headless diff and merge front end for DiffNote.
+
+Usable as a library (compare_files, compare_directories, format_unified,
+format_json, apply_merges) or from the command line:
+
+    python -m diff_cli diff LEFT RIGHT [--format unified|json]
+    python -m diff_cli merge LEFT RIGHT --direction to_right [--output PATH]
+
+LEFT and RIGHT may be files or directories. Nothing here imports Tk.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from character_differ import get_character_diffs, get_file_diffs
+from diff_engines import DEFAULT_ENGINE, ENGINES, get_engine, opcodes_from_blocks
+from file_loader import read_text
+from file_utils import file_digest, write_text_atomic
+
+def compare_files(path1, path2, engine=DEFAULT_ENGINE, encoding='utf-8'):
+    """
+    Diffs two files.
+
+    Returns:
+        A list of (tag, i1, i2, j1, j2) character opcodes.
+    """
+    return get_file_diffs(path1, path2, engine=engine, encoding=encoding)
+
+def files_identical(path1, path2):
+    """Returns True if two files have the same content, checking sizes before hashing."""
+    if os.path.getsize(path1) != os.path.getsize(path2):
+        return False
+    return file_digest(path1) == file_digest(path2)
+
+def _relative_files(root):
+    """Returns the set of file paths under root, relative to it and using '/' separators."""
+    files = set()
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            files.add(os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, '/'))
+    return files
+
+def _diff_pair(path1, path2, engine, encoding, output_format, context):
+    """Worker for compare_directories: None for identical files, else their diff, rendered if asked to."""
+    if files_identical(path1, path2):
+        return None
+    if output_format == 'unified':
+        return format_unified(read_text(path1, encoding), read_text(path2, encoding),
+                              path1, path2, engine=engine, context=context)
+    return get_file_diffs(path1, path2, engine=engine, encoding=encoding)
+
+def compare_directories(dir1, dir2, engine=DEFAULT_ENGINE, encoding='utf-8', output_format='json', context=3, jobs=None):
+    """
+    Compares two directory trees file by file.
+
+    Every pair is handled on a process pool: files with equal size and
+    content hash are reported as identical without diffing, the others are
+    diffed, so hashing runs in parallel like the diffs. A pair that cannot
+    be read is reported as an error without stopping the others.
+
+    Args:
+        dir1: The left directory.
+        dir2: The right directory.
+        engine: Name of the diff engine.
+        encoding: Text encoding of the files.
+        output_format: 'json' to collect opcodes, 'unified' for unified diff text.
+        context: Context lines for unified output.
+        jobs: Number of worker processes (defaults to the CPU count).
+
+    Yields:
+        (relative_path, status, result) tuples in path order, where status is
+        'identical', 'different', 'only_left', 'only_right' or 'error', and
+        result is the opcodes or unified text for 'different' pairs, the error
+        message for 'error', and None otherwise.
+    """
+    left = _relative_files(dir1)
+    right = _relative_files(dir2)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {name: pool.submit(_diff_pair, os.path.join(dir1, name), os.path.join(dir2, name),
+                                     engine, encoding, output_format, context)
+                   for name in sorted(left & right)}
+
+        for name in sorted(left | right):
+            if name not in right:
+                yield name, 'only_left', None
+                continue
+            if name not in left:
+                yield name, 'only_right', None
+                continue
+            try:
+                result = futures[name].result()
+            except (OSError, UnicodeDecodeError) as e:
+                yield name, 'error', str(e)
+                continue
+            yield name, 'identical' if result is None else 'different', result
+
+def _split_lines(text):
+    """Splits text on '\\n', keeping the terminators, like the viewer's line index does."""
+    lines = [line + '\n' for line in text.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+def _group_opcodes(opcodes, context):
+    """Groups line opcodes into hunks with context, like difflib.SequenceMatcher.get_grouped_opcodes()."""
+    if not opcodes:
+        return
+    opcodes = list(opcodes)
+    tag, i1, i2, j1, j2 = opcodes[0]
+    if tag == 'equal':
+        opcodes[0] = (tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2)
+    tag, i1, i2, j1, j2 = opcodes[-1]
+    if tag == 'equal':
+        opcodes[-1] = (tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context))
+
+    group = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal' and i2 - i1 > 2 * context:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+def _format_range(start, stop):
+    length = stop - start
+    beginning = start + 1 if length else start
+    return f"{beginning}" if length == 1 else f"{beginning},{length}"
+
+def format_unified(text1, text2, name1='a', name2='b', engine=DEFAULT_ENGINE, context=3):
+    """
+    Renders a unified diff of two texts, diffing them line by line.
+
+    Returns:
+        The diff as a string; empty if the texts are identical.
+    """
+    lines1, lines2 = _split_lines(text1), _split_lines(text2)
+    blocks = get_engine(engine)(lines1, lines2)
+    opcodes = opcodes_from_blocks(blocks, len(lines1), len(lines2))
+    if all(tag == 'equal' for tag, *_ in opcodes):
+        return ""
+
+    out = [f"--- {name1}\n", f"+++ {name2}\n"]
+    for group in _group_opcodes(opcodes, context):
+        _, i1, _, j1, _ = group[0]
+        _, _, i2, _, j2 = group[-1]
+        out.append(f"@@ -{_format_range(i1, i2)} +{_format_range(j1, j2)} @@\n")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                out.extend(_prefixed(' ', lines1[i1:i2]))
+                continue
+            out.extend(_prefixed('-', lines1[i1:i2]))
+            out.extend(_prefixed('+', lines2[j1:j2]))
+    return "".join(out)
+
+def _prefixed(prefix, lines):
+    for line in lines:
+        if line.endswith('\n'):
+            yield prefix + line
+        else:
+            yield prefix + line + "\n\\ No newline at end of file\n"
+
+def format_json(opcodes, name1=None, name2=None):
+    """Renders opcodes as a JSON document."""
+    return json.dumps({"left": name1, "right": name2, "opcodes": [list(opcode) for opcode in opcodes]})
+
+def apply_merges(text1, text2, opcodes, direction, indices=None):
+    """
+    Applies hunks from one side to the other in a single pass.
+
+    Args:
+        text1: The left text.
+        text2: The right text.
+        opcodes: Opcodes of the diff between them.
+        direction: 'to_right' to copy left hunks into the right text,
+            'to_left' to copy right hunks into the left text.
+        indices: Optional collection of opcode indices to apply; all
+            changed hunks are applied if omitted.
+
+    Returns:
+        The merged text (the new right text for 'to_right', the new left
+        text for 'to_left').
+    """
+    if direction not in ('to_right', 'to_left'):
+        raise ValueError(f"Unknown merge direction {direction!r}")
+    pieces = []
+    for op_idx, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        apply = tag != 'equal' and (indices is None or op_idx in indices)
+        if direction == 'to_right':
+            pieces.append(text1[i1:i2] if apply else text2[j1:j2])
+        else:
+            pieces.append(text2[j1:j2] if apply else text1[i1:i2])
+    return "".join(pieces)
+
+def _run_diff(args):
+    if os.path.isdir(args.left) and os.path.isdir(args.right):
+        found_differences = False
+        documents = []
+        for name, status, result in compare_directories(args.left, args.right, args.engine, args.encoding,
+                                                        args.format, args.context, args.jobs):
+            if status == 'identical':
+                continue
+            found_differences = True
+            if args.format == 'json':
+                document = {"path": name, "status": status, "opcodes": result if status == 'different' else None}
+                if status == 'error':
+                    document["error"] = result
+                documents.append(document)
+            elif status == 'different':
+                sys.stdout.write(result)
+            elif status == 'error':
+                print(f"Error comparing {name}: {result}", file=sys.stderr)
+            else:
+                side = args.left if status == 'only_left' else args.right
+                print(f"Only in {side}: {name}")
+        if args.format == 'json':
+            print(json.dumps(documents))
+        return 1 if found_differences else 0
+
+    if args.format == 'unified':
+        # The unified formatter does its own line diff; an empty result means the files are identical.
+        output = format_unified(read_text(args.left, args.encoding), read_text(args.right, args.encoding),
+                                args.left, args.right, args.engine, args.context)
+        sys.stdout.write(output)
+        return 1 if output else 0
+    opcodes = compare_files(args.left, args.right, args.engine, args.encoding)
+    print(format_json(opcodes, args.left, args.right))
+    return 1 if any(tag != 'equal' for tag, *_ in opcodes) else 0
+
+def _run_merge(args):
+    text1 = read_text(args.left, args.encoding)
+    text2 = read_text(args.right, args.encoding)
+    # The same line-then-character diff compare_files() runs, on the texts already in memory.
+    opcodes = get_character_diffs(text1, text2, args.engine, hierarchical=True)
+    merged = apply_merges(text1, text2, opcodes, args.direction)
+    target = args.output or (args.right if args.direction == 'to_right' else args.left)
+    write_text_atomic(target, merged, args.encoding)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="diff_cli", description="Compare and merge text files without the GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(subparser):
+        subparser.add_argument("left")
+        subparser.add_argument("right")
+        subparser.add_argument("--engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE)
+        subparser.add_argument("--encoding", default='utf-8')
+
+    diff_parser = subparsers.add_parser("diff", help="compare two files or directory trees")
+    add_common(diff_parser)
+    diff_parser.add_argument("--format", choices=("unified", "json"), default="unified")
+    diff_parser.add_argument("--context", type=int, default=3, help="context lines for unified output")
+    diff_parser.add_argument("--jobs", type=int, default=None, help="worker processes for directory mode")
+
+    merge_parser = subparsers.add_parser("merge", help="apply every hunk from one file to the other")
+    add_common(merge_parser)
+    merge_parser.add_argument("--direction", choices=("to_right", "to_left"), required=True)
+    merge_parser.add_argument("--output", help="write the merged text here instead of over the target file")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "diff":
+            return _run_diff(args)
+        return _run_merge(args)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"diff_cli: {e}", file=sys.stderr)
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,441 @@
+import bisect
+import difflib
+
+# Edit cost after which the Myers search stops looking for a minimal split
+# and splits at the furthest point it reached instead, like git's xdiff:
+# the limit is sqrt(n + m) of the region, but never less than this.
+MYERS_MIN_COST = 64
+
+
+def _common_prefix(a, i, i_end, b, j, j_end):
+    """
+    Returns the length of the common run starting at a[i] and b[j].
+
+    Long runs are measured by galloping over slice comparisons, so the
+    per-element work happens in C instead of the Python loop.
+    """
+    n = min(i_end - i, j_end - j)
+    if n <= 0 or a[i] != b[j]:
+        return 0
+    good = 1
+    step = 1
+    while good < n:
+        k = min(good + step, n)
+        if a[i + good:i + k] == b[j + good:j + k]:
+            good = k
+            step *= 2
+            continue
+        lo, hi = good, k
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if a[i + lo:i + mid] == b[j + lo:j + mid]:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+    return good
+
+
+def _common_suffix(a, i, i_end, b, j, j_end):
+    """Returns the length of the common run ending just before a[i_end] and b[j_end]."""
+    n = min(i_end - i, j_end - j)
+    if n <= 0 or a[i_end - 1] != b[j_end - 1]:
+        return 0
+    good = 1
+    step = 1
+    while good < n:
+        k = min(good + step, n)
+        if a[i_end - k:i_end - good] == b[j_end - k:j_end - good]:
+            good = k
+            step *= 2
+            continue
+        lo, hi = good, k
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if a[i_end - mid:i_end - lo] == b[j_end - mid:j_end - lo]:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+    return good
+
+
+def _middle_snake(a, alo, ahi, b, blo, bhi, checkpoint=None):
+    """
+    Finds the middle snake of the shortest edit script for a[alo:ahi] and b[blo:bhi].
+
+    Once the edit cost passes sqrt(n + m) (at least MYERS_MIN_COST) the
+    search gives up on minimality and returns an empty snake at whichever
+    of the forward or backward fronts got furthest, so very dissimilar
+    inputs cost O((n + m) * sqrt(n + m)) rather than O((n + m) ** 2). The
+    edit script stays valid, it is just no longer the shortest one.
+
+    Returns:
+        A tuple (x1, y1, x2, y2) of offsets relative to alo/blo. The snake
+        runs from (x1, y1) to (x2, y2) along a diagonal of equal elements.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    max_cost = max(MYERS_MIN_COST, int((n + m) ** 0.5))
+    # Furthest-reaching x per diagonal; dicts keep memory proportional to D
+    # rather than to the length of the inputs.
+    vf = {1: 0}
+    vb = {1: 0}
+
+    for d in range(max_d + 1):
+        if checkpoint:
+            checkpoint()
+        # Forward search from the top-left corner.
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[k - 1] < vf[k + 1]):
+                x = vf[k + 1]
+            else:
+                x = vf[k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            if x < n and y < m and a[alo + x] == b[blo + y]:
+                run = _common_prefix(a, alo + x, ahi, b, blo + y, bhi)
+                x += run
+                y += run
+            vf[k] = x
+            kb = delta - k
+            if odd and -(d - 1) <= kb <= d - 1 and x + vb[kb] >= n:
+                return x0, y0, x, y
+
+        # Backward search from the bottom-right corner, in reversed coordinates.
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[k - 1] < vb[k + 1]):
+                x = vb[k + 1]
+            else:
+                x = vb[k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            if x < n and y < m and a[ahi - x - 1] == b[bhi - y - 1]:
+                run = _common_suffix(a, alo, ahi - x, b, blo, bhi - y)
+                x += run
+                y += run
+            vb[k] = x
+            kf = delta - k
+            if not odd and -d <= kf <= d and x + vf[kf] >= n:
+                return n - x, m - y, n - x0, m - y0
+
+        if d >= max_cost:
+            split = _furthest_split(vf, vb, d, n, m)
+            if split is not None:
+                return split
+
+    raise AssertionError("middle snake not found")
+
+
+def _furthest_split(vf, vb, d, n, m):
+    """
+    Picks the point furthest from its corner among the forward and backward fronts after d edits.
+
+    Returns:
+        An empty snake (x, y, x, y) strictly inside the region, or None if
+        neither front has a point there yet.
+    """
+    best_forward = best_backward = None
+    for k in range(-d, d + 1, 2):
+        x = vf[k]
+        y = x - k
+        if 0 <= x <= n and 0 <= y <= m and 0 < x + y < n + m:
+            if best_forward is None or x + y > best_forward[0] + best_forward[1]:
+                best_forward = (x, y)
+        x = vb[k]
+        y = x - k
+        if 0 <= x <= n and 0 <= y <= m and 0 < x + y < n + m:
+            if best_backward is None or x + y > best_backward[0] + best_backward[1]:
+                best_backward = (n - x, m - y)
+    if best_backward is not None and (
+            best_forward is None or n + m - sum(best_backward) > sum(best_forward)):
+        x, y = best_backward
+    elif best_forward is not None:
+        x, y = best_forward
+    else:
+        return None
+    return x, y, x, y
+
+
+def myers_matching_blocks(a, b, checkpoint=None):
+    """
+    Computes matching blocks with Myers' linear-space O(ND) algorithm.
+
+    Regions whose edit cost passes the MYERS_MIN_COST heuristic are split
+    greedily (see _middle_snake()), so the result of very dissimilar inputs
+    may be longer than the minimal edit script.
+
+    Args:
+        a: The first sequence (a string or a list of hashable items).
+        b: The second sequence.
+        checkpoint: Optional callable invoked periodically during long
+            searches; it may raise to abort the diff.
+
+    Returns:
+        A sorted list of (i, j, size) triples with a[i:i+size] == b[j:j+size].
+    """
+    blocks = []
+    _myers_range(a, 0, len(a), b, 0, len(b), blocks, checkpoint)
+    blocks.sort()
+    return blocks
+
+
+def _myers_range(a, alo, ahi, b, blo, bhi, blocks, checkpoint=None):
+    # Divide and conquer with an explicit stack so deep recursions cannot
+    # hit the interpreter's recursion limit.
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        if checkpoint:
+            checkpoint()
+        alo, ahi, blo, bhi = stack.pop()
+        prefix = _common_prefix(a, alo, ahi, b, blo, bhi)
+        if prefix:
+            blocks.append((alo, blo, prefix))
+            alo += prefix
+            blo += prefix
+        suffix = _common_suffix(a, alo, ahi, b, blo, bhi)
+        if suffix:
+            blocks.append((ahi - suffix, bhi - suffix, suffix))
+            ahi -= suffix
+            bhi -= suffix
+        if alo == ahi or blo == bhi:
+            continue
+
+        x1, y1, x2, y2 = _middle_snake(a, alo, ahi, b, blo, bhi, checkpoint)
+        if x2 > x1:
+            blocks.append((alo + x1, blo + y1, x2 - x1))
+        stack.append((alo + x2, ahi, blo + y2, bhi))
+        stack.append((alo, alo + x1, blo, blo + y1))
+
+
+def _unique_positions(seq, lo, hi):
+    """Maps every item that occurs exactly once in seq[lo:hi] to its position."""
+    seen = {}
+    for i in range(lo, hi):
+        item = seq[i]
+        seen[item] = -1 if item in seen else i
+    return {item: i for item, i in seen.items() if i >= 0}
+
+
+def _longest_increasing(pairs):
+    """Returns the longest subsequence of pairs whose second members increase (patience sorting)."""
+    tails = []
+    tail_idx = []
+    back = [None] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(idx)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = idx
+        back[idx] = tail_idx[pos - 1] if pos else None
+    result = []
+    idx = tail_idx[-1] if tail_idx else None
+    while idx is not None:
+        result.append(pairs[idx])
+        idx = back[idx]
+    result.reverse()
+    return result
+
+
+def patience_matching_blocks(a, b, checkpoint=None):
+    """
+    Computes matching blocks with the patience diff algorithm.
+
+    Items that occur exactly once on both sides are used as anchors; the
+    gaps between anchors are solved recursively, falling back to Myers when
+    a gap has no unique items left.
+
+    Args:
+        a: The first sequence.
+        b: The second sequence.
+        checkpoint: Optional callable invoked periodically; it may raise
+            to abort the diff.
+
+    Returns:
+        A sorted list of (i, j, size) triples.
+    """
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        if checkpoint:
+            checkpoint()
+        alo, ahi, blo, bhi = stack.pop()
+        prefix = _common_prefix(a, alo, ahi, b, blo, bhi)
+        if prefix:
+            blocks.append((alo, blo, prefix))
+            alo += prefix
+            blo += prefix
+        suffix = _common_suffix(a, alo, ahi, b, blo, bhi)
+        if suffix:
+            blocks.append((ahi - suffix, bhi - suffix, suffix))
+            ahi -= suffix
+            bhi -= suffix
+        if alo == ahi or blo == bhi:
+            continue
+
+        unique_a = _unique_positions(a, alo, ahi)
+        unique_b = _unique_positions(b, blo, bhi)
+        pairs = sorted((i, unique_b[item]) for item, i in unique_a.items() if item in unique_b)
+        anchors = _longest_increasing(pairs)
+        if not anchors:
+            _myers_range(a, alo, ahi, b, blo, bhi, blocks, checkpoint)
+            continue
+
+        prev_i, prev_j = alo, blo
+        for i, j in anchors:
+            blocks.append((i, j, 1))
+            stack.append((prev_i, i, prev_j, j))
+            prev_i, prev_j = i + 1, j + 1
+        stack.append((prev_i, ahi, prev_j, bhi))
+
+    blocks.sort()
+    return blocks
+
+
+HISTOGRAM_MAX_CHAIN = 64
+
+
+def histogram_matching_blocks(a, b, checkpoint=None):
+    """
+    Computes matching blocks with the histogram diff algorithm.
+
+    Each region is split around the longest common run that contains the
+    least frequent item of a, which favours rare, meaningful matches much
+    like patience diff. Regions where every item is too common fall back
+    to Myers.
+
+    Args:
+        a: The first sequence.
+        b: The second sequence.
+        checkpoint: Optional callable invoked periodically; it may raise
+            to abort the diff.
+
+    Returns:
+        A sorted list of (i, j, size) triples.
+    """
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        if checkpoint:
+            checkpoint()
+        alo, ahi, blo, bhi = stack.pop()
+        prefix = _common_prefix(a, alo, ahi, b, blo, bhi)
+        if prefix:
+            blocks.append((alo, blo, prefix))
+            alo += prefix
+            blo += prefix
+        suffix = _common_suffix(a, alo, ahi, b, blo, bhi)
+        if suffix:
+            blocks.append((ahi - suffix, bhi - suffix, suffix))
+            ahi -= suffix
+            bhi -= suffix
+        if alo == ahi or blo == bhi:
+            continue
+
+        occurrences = {}
+        for i in range(alo, ahi):
+            occurrences.setdefault(a[i], []).append(i)
+
+        best = None  # (count, -size, i, j, size)
+        for j in range(blo, bhi):
+            positions = occurrences.get(b[j])
+            if not positions or len(positions) > HISTOGRAM_MAX_CHAIN:
+                continue
+            count = len(positions)
+            if best is not None and count > best[0]:
+                continue
+            for i in positions:
+                start_i, start_j = i, j
+                while start_i > alo and start_j > blo and a[start_i - 1] == b[start_j - 1]:
+                    start_i -= 1
+                    start_j -= 1
+                size = i + 1 - start_i + _common_prefix(a, i + 1, ahi, b, j + 1, bhi)
+                candidate = (count, -size, start_i, start_j, size)
+                if best is None or candidate < best:
+                    best = candidate
+
+        if best is None:
+            _myers_range(a, alo, ahi, b, blo, bhi, blocks, checkpoint)
+            continue
+
+        _, _, i, j, size = best
+        blocks.append((i, j, size))
+        stack.append((i + size, ahi, j + size, bhi))
+        stack.append((alo, i, blo, j))
+
+    blocks.sort()
+    return blocks
+
+
+def difflib_matching_blocks(a, b, checkpoint=None):
+    """
+    Computes matching blocks with difflib.SequenceMatcher, with the autojunk heuristic disabled.
+
+    SequenceMatcher runs as a single call, so checkpoint is only invoked once
+    before it starts.
+    """
+    if checkpoint:
+        checkpoint()
+    s = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return [tuple(block) for block in s.get_matching_blocks() if block.size]
+
+
+ENGINES = {
+    "myers": myers_matching_blocks,
+    "patience": patience_matching_blocks,
+    "histogram": histogram_matching_blocks,
+    "difflib": difflib_matching_blocks,
+}
+
+DEFAULT_ENGINE = "myers"
+
+
+def get_engine(name):
+    """
+    Looks up a diff engine by name.
+
+    Raises:
+        ValueError: If no engine is registered under that name.
+    """
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown diff engine {name!r}; expected one of {', '.join(sorted(ENGINES))}") from None
+
+
+def opcodes_from_blocks(blocks, len_a, len_b):
+    """
+    Converts sorted matching blocks into difflib-style opcodes.
+
+    Args:
+        blocks: A sorted list of (i, j, size) triples.
+        len_a: Length of the first sequence.
+        len_b: Length of the second sequence.
+
+    Returns:
+        A list of (tag, i1, i2, j1, j2) tuples, exactly as
+        difflib.SequenceMatcher.get_opcodes() would produce them.
+    """
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in list(blocks) + [(len_a, len_b, 0)]:
+        if i < ai and j < bj:
+            opcodes.append(('replace', i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(('delete', i, ai, j, bj))
+        elif j < bj:
+            opcodes.append(('insert', i, ai, j, bj))
+        if size:
+            if opcodes and opcodes[-1][0] == 'equal':
+                _, ei1, _, ej1, _ = opcodes[-1]
+                opcodes[-1] = ('equal', ei1, ai + size, ej1, bj + size)
+            else:
+                opcodes.append(('equal', ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return opcodes
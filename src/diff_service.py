@@ -0,0 +1,341 @@
+import multiprocessing
+import threading
+import time
+from collections import namedtuple
+
+import perf_trace
+from character_differ import DiffCancelled, get_character_diffs, get_three_way_merge
+from file_loader import read_text
+from file_utils import file_signature
+
+# Inputs larger than this (characters, all inputs combined) are diffed in
+# a separate process so the pure-Python engine cannot starve the Tk thread of
+# the GIL. Smaller inputs use a thread, which avoids the process start-up cost.
+PROCESS_THRESHOLD = 1_000_000
+
+# What submit_files() and submit_merge_files() deliver: the texts read from
+# the files, in the order the paths were given, the file_signature() of the
+# contents each was read from (None if the file changed while it was read)
+# and the result for them.
+FilesResult = namedtuple("FilesResult", "texts signatures result")
+
+def _read_file(path, encoding):
+    """Reads a text file; returns the text and the signature of the contents it holds, or None for that."""
+    signature = file_signature(path)
+    text = read_text(path, encoding)
+    return text, signature if file_signature(path) == signature else None
+
+class _ThreadJob:
+    """A diff running on a daemon thread with cooperative cancellation."""
+
+    def __init__(self, function, args, options):
+        self.progress = None
+        self.outcome = None
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(function, args, options), daemon=True)
+        self._thread.start()
+
+    def _run(self, function, args, options):
+        def report(done, total):
+            if self._cancel_event.is_set():
+                raise DiffCancelled()
+            self.progress = (done, total)
+
+        try:
+            self.outcome = ('result', function(*args, progress=report, **options))
+        except DiffCancelled:
+            self.outcome = ('cancelled', None)
+        except Exception as e:
+            self.outcome = ('error', e)
+
+    def poll(self):
+        return self.progress, self.outcome
+
+    def cancel(self):
+        self._cancel_event.set()
+
+def _run_in_process(conn, function, args, options):
+    """Entry point of a diff worker process; streams progress and the result over conn."""
+    last = [-1]
+
+    def report(done, total):
+        # Only send a message when the visible percentage changes.
+        percent = done * 100 // total if total else 100
+        if percent != last[0]:
+            last[0] = percent
+            conn.send(('progress', (done, total)))
+
+    try:
+        conn.send(('result', function(*args, progress=report, **options)))
+    except Exception as e:
+        conn.send(('error', e))
+    finally:
+        conn.close()
+
+class _ProcessJob:
+    """A diff running in a child process, which is terminated on cancellation."""
+
+    def __init__(self, function, args, options):
+        self.progress = None
+        self.outcome = None
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe(duplex=False)
+        self._process = context.Process(target=_run_in_process, args=(child_conn, function, args, options), daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def poll(self):
+        try:
+            while self.outcome is None and self._conn.poll():
+                kind, value = self._conn.recv()
+                if kind == 'progress':
+                    self.progress = value
+                else:
+                    self.outcome = (kind, value)
+        except (EOFError, OSError):
+            self.outcome = ('error', RuntimeError("Diff worker exited unexpectedly"))
+        if self.outcome is not None:
+            self._conn.close()
+            self._process.join(timeout=0)
+        return self.progress, self.outcome
+
+    def cancel(self):
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+        self.outcome = ('cancelled', None)
+
+class _CachingJob:
+    """
+    A diff that is looked up in a DiffCache before it is run.
+
+    Building the key hashes both inputs in full, so the key is computed
+    and looked up on a daemon thread; the diff job itself is only started
+    on a miss. Its result is stored from another daemon thread, keeping
+    the disk write off the Tk thread as well.
+    """
+
+    def __init__(self, cache, key_function, start_job):
+        self.cache = cache
+        self._key = None
+        self._inner = None
+        self._outcome = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+        threading.Thread(target=self._lookup, args=(key_function, start_job), daemon=True).start()
+
+    def _lookup(self, key_function, start_job):
+        try:
+            key = key_function()
+            cached = self.cache.get(key)
+        except Exception as e:
+            self._outcome = ('error', e)
+            return
+        with self._lock:
+            if self._cancelled:
+                return
+            self._key = key
+            if cached is not None:
+                self._outcome = ('result', cached)
+            else:
+                self._inner = start_job()
+
+    def poll(self):
+        if self._outcome is not None:
+            return None, self._outcome
+        inner = self._inner
+        if inner is None:
+            return None, None
+        progress, outcome = inner.poll()
+        if outcome is not None and outcome[0] == 'result':
+            threading.Thread(target=self.cache.put, args=(self._key, outcome[1]), daemon=True).start()
+        return progress, outcome
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            if self._inner is not None:
+                self._inner.cancel()
+
+class _ReadingJob:
+    """
+    A diff of files that are read on a daemon thread first.
+
+    start_job(*texts) starts the diff once every file is read. Its result
+    is delivered as a FilesResult along with the texts and the signatures
+    of the contents they were read from, so the Tk thread never reads the
+    files and the result always describes exactly the texts it receives.
+    """
+
+    def __init__(self, paths, encoding, start_job):
+        self._texts = None
+        self._signatures = None
+        self._inner = None
+        self._outcome = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read, args=(paths, encoding, start_job), daemon=True).start()
+
+    def _read(self, paths, encoding, start_job):
+        try:
+            texts, signatures = zip(*(_read_file(path, encoding) for path in paths))
+        except Exception as e:
+            self._outcome = ('error', e)
+            return
+        with self._lock:
+            if self._cancelled:
+                return
+            self._texts = texts
+            self._signatures = signatures
+            self._inner = start_job(*texts)
+
+    def poll(self):
+        if self._outcome is not None:
+            return None, self._outcome
+        inner = self._inner
+        if inner is None:
+            return None, None
+        progress, outcome = inner.poll()
+        if outcome is not None and outcome[0] == 'result':
+            outcome = ('result', FilesResult(self._texts, self._signatures, outcome[1]))
+        return progress, outcome
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            if self._inner is not None:
+                self._inner.cancel()
+
+class DiffService:
+    """
+    Runs diffs off the Tk main loop and delivers the results on it.
+
+    Only one diff is active at a time: submitting a new request cancels the
+    previous one, and results of superseded requests are never delivered.
+    Progress and completion are picked up by polling with after(), so all
+    callbacks run on the Tk thread.
+
+    If a DiffCache is given, results are looked up by content digest before
+    any work is started and stored once a diff completes.
+    """
+
+    def __init__(self, widget, poll_interval=50, process_threshold=PROCESS_THRESHOLD, cache=None):
+        self.widget = widget
+        self.poll_interval = poll_interval
+        self.process_threshold = process_threshold
+        self.cache = cache
+        self._job = None
+        self._callbacks = None
+        self._job_name = None
+        self._job_start = 0.0
+        self._poll_id = None
+        self.generation = 0
+
+    @property
+    def busy(self):
+        return self._job is not None
+
+    def submit(self, text1, text2, on_done, on_progress=None, on_error=None, **options):
+        """
+        Starts diffing text1 against text2 in the background.
+
+        Args:
+            text1: The first string.
+            text2: The second string.
+            on_done: Called with the opcodes when the diff completes; results
+                served from the cache arrive as an OpcodeArray.
+            on_progress: Optional, called with (done, total) while running.
+            on_error: Optional, called with the exception if the diff fails.
+            **options: Passed through to get_character_diffs().
+
+        Returns:
+            The generation number identifying this request.
+        """
+        return self._start("get_character_diffs",
+                           lambda: self._new_job(get_character_diffs, (text1, text2), options, cacheable=True),
+                           on_done, on_progress, on_error)
+
+    def submit_files(self, path1, path2, on_done, on_progress=None, on_error=None, encoding='utf-8', **options):
+        """
+        Reads two files and diffs their texts in the background, like submit().
+
+        The files are read on a daemon thread rather than the Tk thread.
+        on_done receives a FilesResult with both texts and their opcodes;
+        the other arguments and the return value are as for submit().
+        """
+        start_job = lambda: _ReadingJob(
+            (path1, path2), encoding,
+            lambda *texts: self._new_job(get_character_diffs, texts, options, cacheable=True))
+        return self._start("get_character_diffs", start_job, on_done, on_progress, on_error)
+
+    def submit_merge_files(self, base_path, path1, path2, on_done, on_progress=None, on_error=None,
+                           encoding='utf-8', **options):
+        """
+        Reads three files and merges the last two against the first with get_three_way_merge().
+
+        The files are read on a daemon thread. on_done receives a
+        FilesResult with the base, left and right texts and the
+        ThreeWayMerge. Merge results are not cached; the other arguments and
+        the return value are as for submit().
+        """
+        start_job = lambda: _ReadingJob(
+            (base_path, path1, path2), encoding,
+            lambda *texts: self._new_job(get_three_way_merge, texts, options, cacheable=False))
+        return self._start("get_three_way_merge", start_job, on_done, on_progress, on_error)
+
+    def _new_job(self, function, args, options, cacheable):
+        """Creates a job running function(*args, **options); may be called from a _ReadingJob's thread."""
+        job_class = _ProcessJob if sum(map(len, args)) > self.process_threshold else _ThreadJob
+        start_job = lambda: job_class(function, args, options)
+        if self.cache and cacheable:
+            key_function = lambda: self.cache.text_key(*args, source='texts', **options)
+            return _CachingJob(self.cache, key_function, start_job)
+        return start_job()
+
+    def _start(self, name, start_job, on_done, on_progress, on_error):
+        self.cancel()
+        self.generation += 1
+        self._job = start_job()
+        self._callbacks = (on_done, on_progress, on_error)
+        self._job_name = name
+        self._job_start = time.perf_counter()
+        self._schedule_poll()
+        return self.generation
+
+    def cancel(self):
+        """Cancels the running diff, if any; its result will be discarded."""
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+            self._callbacks = None
+        if self._poll_id is not None:
+            self.widget.after_cancel(self._poll_id)
+            self._poll_id = None
+
+    def _schedule_poll(self):
+        self._poll_id = self.widget.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        job = self._job
+        if job is None:
+            return
+        progress, outcome = job.poll()
+        on_done, on_progress, on_error = self._callbacks
+        if outcome is None:
+            if on_progress and progress is not None:
+                on_progress(*progress)
+            self._schedule_poll()
+            return
+
+        self._job = None
+        self._callbacks = None
+        if perf_trace.enabled():
+            # Process jobs are invisible to the trace otherwise; this is their wall time as seen from here.
+            perf_trace.record(f"diff_service.{self._job_name}", self._job_start,
+                              time.perf_counter() - self._job_start, "diff")
+        kind, value = outcome
+        if kind == 'result':
+            on_done(value)
+        elif kind == 'error' and on_error:
+            on_error(value)
@@ -1,26 +1,68 @@
 import customtkinter as ctk
 import tkinter as tk
+from line_alignment import LineAlignment
+from line_index import LineIndex
+from opcode_model import OpcodeModel
+from perf_trace import count, traced
+from ui_components import text_area
+
+# Highlight tag for each opcode tag, per side of the comparison.
+HIGHLIGHT_TAGS = {
+    1: {'delete': "deletion", 'replace': "replace_old"},
+    2: {'insert': "addition", 'replace': "replace_new"},
+}
+
+GUTTER_WIDTH = 50
+ARROW_FILL = "#3A7EBF"
 
 class DiffViewer(ctk.CTkFrame):
-    def __init__(self, master, merge_callback=None, **kwargs):
+    def __init__(self, master, merge_callback=None, windowed=True, **kwargs):
         super().__init__(master, **kwargs)
         self.merge_callback = merge_callback
+        # In windowed mode only the hunks inside the visible lines are tagged,
+        # and the tags are refreshed as the panes scroll.
+        self.windowed = windowed
+        self.opcodes = None
+        self._render_pending = None
+        # Maps lines between the panes; rebuilt lazily after edits.
+        self.alignment = None
+        # The pane the user is scrolling; the other one follows it.
+        self._scroll_driver = 1
 
         self.grid_columnconfigure(0, weight=1)
-        self.grid_columnconfigure(1, weight=0) # Column for merge buttons
-        self.grid_columnconfigure(2, weight=1)
+        self.grid_columnconfigure(2, weight=0) # Column for merge buttons
+        self.grid_columnconfigure(3, weight=1)
         self.grid_rowconfigure(0, weight=1)
 
         self.font = ctk.CTkFont(family="Courier", size=12)
 
-        self.text_widget1 = ctk.CTkTextbox(self, font=self.font, wrap="none", state="disabled")
-        self.text_widget1.grid(row=0, column=0, sticky="nsew", padx=(5, 2), pady=5)
-
-        self.merge_button_frame = ctk.CTkFrame(self, fg_color="transparent")
-        self.merge_button_frame.grid(row=0, column=1, sticky="ns")
-
-        self.text_widget2 = ctk.CTkTextbox(self, font=self.font, wrap="none", state="disabled")
-        self.text_widget2.grid(row=0, column=2, sticky="nsew", padx=(2, 5), pady=5)
+        self.text_widget1 = ctk.CTkTextbox(self, font=self.font, wrap="none", state="disabled", activate_scrollbars=False)
+        self.text_widget1.grid(row=0, column=0, sticky="nsew", padx=(5, 0), pady=(5, 0))
+        self.y_scrollbar1 = ctk.CTkScrollbar(self, command=self.text_widget1.yview)
+        self.y_scrollbar1.grid(row=0, column=1, sticky="ns", pady=(5, 0))
+        self.x_scrollbar1 = ctk.CTkScrollbar(self, orientation="horizontal", command=self.text_widget1.xview)
+        self.x_scrollbar1.grid(row=1, column=0, sticky="ew", padx=(5, 0), pady=(0, 5))
+
+        # Merge arrows are drawn on one canvas next to their hunks instead of
+        # being separate button widgets.
+        self.merge_gutter = tk.Canvas(self, width=GUTTER_WIDTH, bg='#ECECEC', highlightthickness=0)
+        self.merge_gutter.grid(row=0, column=2, sticky="ns", pady=(5, 0))
+        self.merge_gutter.bind("<Button-1>", self._on_gutter_click)
+        self.merge_gutter.bind("<Configure>", lambda event: self._schedule_render())
+        self._gutter_items = {}
+
+        self.text_widget2 = ctk.CTkTextbox(self, font=self.font, wrap="none", state="disabled", activate_scrollbars=False)
+        self.text_widget2.grid(row=0, column=3, sticky="nsew", pady=(5, 0))
+        self.y_scrollbar2 = ctk.CTkScrollbar(self, command=self.text_widget2.yview)
+        self.y_scrollbar2.grid(row=0, column=4, sticky="ns", padx=(0, 5), pady=(5, 0))
+        self.x_scrollbar2 = ctk.CTkScrollbar(self, orientation="horizontal", command=self.text_widget2.xview)
+        self.x_scrollbar2.grid(row=1, column=3, sticky="ew", pady=(0, 5))
+
+        # Scroll notifications drive both the scrollbars and windowed tagging
+        self.text_widget1.configure(yscrollcommand=lambda first, last: self._on_yscroll(1, first, last),
+                                    xscrollcommand=self.x_scrollbar1.set)
+        self.text_widget2.configure(yscrollcommand=lambda first, last: self._on_yscroll(2, first, last),
+                                    xscrollcommand=self.x_scrollbar2.set)
 
         # Configure tags for highlighting
         self.text_widget1.tag_config("deletion", background="#FADBD8")
@@ -28,89 +70,179 @@ class DiffViewer(ctk.CTkFrame):
         self.text_widget1.tag_config("replace_old", background="#FADBD8")
         self.text_widget2.tag_config("replace_new", background="#D4EFDF")
 
-        # Synchronize scrolling
-        self.text_widget1.bind("<MouseWheel>", self._on_mouse_wheel)
-        self.text_widget2.bind("<MouseWheel>", self._on_mouse_wheel)
+        # Synchronize scrolling: whichever pane the pointer or focus is on
+        # drives, however it is scrolled, and the other follows the alignment.
+        self.text_widget1.bind("<MouseWheel>", lambda event: self._on_mouse_wheel(1, event))
+        self.text_widget2.bind("<MouseWheel>", lambda event: self._on_mouse_wheel(2, event))
         self.text_widget1.bind("<Configure>", self._on_configure)
         self.text_widget2.bind("<Configure>", self._on_configure)
-
-    def _on_mouse_wheel(self, event):
-        self.text_widget1.yview_scroll(-1 * (event.delta // 120), "units")
-        self.text_widget2.yview_scroll(-1 * (event.delta // 120), "units")
+        for side, widgets in ((1, (self.text_widget1, self.y_scrollbar1)), (2, (self.text_widget2, self.y_scrollbar2))):
+            for widget in widgets:
+                widget.bind("<Enter>", lambda event, side=side: self._set_scroll_driver(side), add=True)
+            widgets[0].bind("<FocusIn>", lambda event, side=side: self._set_scroll_driver(side), add=True)
+
+    def _set_scroll_driver(self, side):
+        self._scroll_driver = side
+
+    def _on_mouse_wheel(self, side, event):
+        self._scroll_driver = side
+        widget = self.text_widget1 if side == 1 else self.text_widget2
+        widget.yview_scroll(-1 * (event.delta // 120), "units")
         return "break"
 
     def _on_configure(self, event):
-        # This is a placeholder for potential future scroll synchronization logic
-        pass
-
+        # A resize changes how many lines fit; realign the following pane.
+        self._sync_scroll(self._scroll_driver)
+
+    def _on_yscroll(self, side, first, last):
+        scrollbar = self.y_scrollbar1 if side == 1 else self.y_scrollbar2
+        scrollbar.set(first, last)
+        if side == self._scroll_driver:
+            self._sync_scroll(side)
+        self._schedule_render()
+
+    def _sync_scroll(self, side):
+        """Scrolls the other pane so that its top line corresponds to the top line of pane side."""
+        if self.opcodes is None:
+            return
+        if self.alignment is None:
+            self.alignment = LineAlignment.from_opcodes(self.opcodes, self.line_index1, self.line_index2)
+        source, target = (self.text_widget1, self.text_widget2) if side == 1 else (self.text_widget2, self.text_widget1)
+        target_lines = len(self.line_index2 if side == 1 else self.line_index1)
+
+        # Fractional top line of the source pane: a partly scrolled-out line has a negative y.
+        top_index = source.index("@0,0")
+        top = int(top_index.split(".")[0]) - 1
+        dline = source.dlineinfo(top_index)
+        if dline and dline[3]:
+            top -= dline[1] / dline[3]
+
+        # Without wrapping every line has the same height, so a line maps
+        # directly to a fraction of the other pane's content.
+        target.yview_moveto(self.alignment.map(top, side) / target_lines)
+
+    def _schedule_render(self):
+        """Coalesces tag refreshes into a single idle callback."""
+        if self._render_pending is None:
+            self._render_pending = self.after_idle(self._render_visible)
+
+    @traced("diff_viewer.render_visible", "render")
+    def _render_visible(self):
+        self._render_pending = None
+        self.merge_gutter.delete("all")
+        self._gutter_items = {}
+        if self.opcodes is None:
+            return
+        self._render_side(1, self.text_widget1, self.line_index1)
+        self._render_side(2, self.text_widget2, self.line_index2)
+
+    def _visible_range(self, widget, line_index):
+        """Returns the (lo, hi) character range of the lines currently shown in a pane."""
+        first_line = int(widget.index("@0,0").split(".")[0]) - 1
+        last_line = int(widget.index(f"@0,{widget.winfo_height()}").split(".")[0])
+        lo = line_index.offset_of(first_line)
+        hi = line_index.offset_of(last_line) if last_line < len(line_index) else float("inf")
+        return lo, hi
+
+    def _render_side(self, side, widget, line_index):
+        """Re-applies highlight tags and merge arrows for the hunks that intersect the visible lines of one pane."""
+        tag_names = HIGHLIGHT_TAGS[side]
+        for name in tag_names.values():
+            widget.tag_remove(name, "1.0", "end")
+
+        visible_lo, visible_hi = self._visible_range(widget, line_index)
+        lo, hi = (visible_lo, visible_hi) if self.windowed else (0, float("inf"))
+
+        tagged = 0
+        # 0-based line -> indices of the hunks whose arrow goes on it; hunks
+        # starting on the same line share one arrow.
+        arrows = {}
+        for op_idx, (tag, i1, i2, j1, j2) in self.opcodes.iter_from(self.opcodes.find(lo, side)):
+            start, end = (i1, i2) if side == 1 else (j1, j2)
+            if start >= hi:
+                break
+            name = tag_names.get(tag)
+            if name and end > start:
+                widget.tag_add(name, line_index.index(max(start, lo)), line_index.index(min(end, hi)))
+                tagged += 1
+                if visible_lo <= start < visible_hi:
+                    arrows.setdefault(line_index.line_of(start), []).append(op_idx)
+                elif start < visible_lo < end:
+                    # The hunk starts above the view but fills its top; keep its arrow reachable.
+                    arrows.setdefault(line_index.line_of(visible_lo), []).append(op_idx)
+        for line, op_indices in arrows.items():
+            self._draw_merge_arrow(side, widget, f"{line + 1}.0", op_indices)
+        count("diff_viewer.tags_applied", tagged)
+
+    def _draw_merge_arrow(self, side, widget, index, op_indices):
+        """Draws a merge arrow in the gutter level with a line, merging every hunk in op_indices."""
+        dline = widget.dlineinfo(index)
+        if not dline:
+            return
+        # dlineinfo is relative to the text area inside the textbox's frame; translate it into gutter coordinates.
+        y = text_area(widget).winfo_rooty() - self.merge_gutter.winfo_rooty() + dline[1] + dline[3] // 2
+        direction = 'to_right' if side == 1 else 'to_left'
+        # Left-pane hunks get their arrow on the left half, right-pane hunks on the right half.
+        x = GUTTER_WIDTH // 4 if side == 1 else 3 * GUTTER_WIDTH // 4
+        item = self.merge_gutter.create_text(x, y, text="→" if side == 1 else "←",
+                                             fill=ARROW_FILL, font=self.font, tags=("merge_arrow",))
+        self._gutter_items[item] = (direction, op_indices)
+
+    def _on_gutter_click(self, event):
+        for item in self.merge_gutter.find_overlapping(event.x - 2, event.y - 2, event.x + 2, event.y + 2):
+            target = self._gutter_items.get(item)
+            if target:
+                self._on_merge(*target)
+                return
+
+    @traced("diff_viewer.display_diff", "render")
     def display_diff(self, text1, text2, opcodes):
         self.text_widget1.configure(state="normal")
         self.text_widget2.configure(state="normal")
         self.text_widget1.delete("1.0", "end")
         self.text_widget2.delete("1.0", "end")
 
-        # Clear existing merge buttons
-        for widget in self.merge_button_frame.winfo_children():
-            widget.destroy()
-
-        # Store original texts for merge operations
-        self.original_text1 = text1
-        self.original_text2 = text2
-        self.opcodes = opcodes
+        self.opcodes = opcodes if isinstance(opcodes, OpcodeModel) else OpcodeModel(opcodes)
+        self.line_index1 = LineIndex.from_text(text1)
+        self.line_index2 = LineIndex.from_text(text2)
+        self.alignment = LineAlignment.from_opcodes(self.opcodes, self.line_index1, self.line_index2)
 
         self.text_widget1.insert("1.0", text1)
         self.text_widget2.insert("1.0", text2)
 
-        # Apply tags for highlighting and add merge buttons
-        for op_idx, (tag, i1, i2, j1, j2) in enumerate(opcodes):
-            if tag == 'delete':
-                self.text_widget1.tag_add("deletion", f"1.0+{i1}c", f"1.0+{i2}c")
-                # Add merge button for deletion
-                self._add_merge_buttons(self.merge_button_frame, op_idx, f"1.0+{i1}c", f"1.0+{i2}c", 'to_right')
-            elif tag == 'insert':
-                self.text_widget2.tag_add("addition", f"1.0+{j1}c", f"1.0+{j2}c")
-                # Add merge button for insertion
-                self._add_merge_buttons(self.merge_button_frame, op_idx, f"1.0+{j1}c", f"1.0+{j2}c", 'to_left')
-            elif tag == 'replace':
-                self.text_widget1.tag_add("replace_old", f"1.0+{i1}c", f"1.0+{i2}c")
-                self.text_widget2.tag_add("replace_new", f"1.0+{j1}c", f"1.0+{j2}c")
-                # Add merge buttons for replacement
-                self._add_merge_buttons(self.merge_button_frame, op_idx, f"1.0+{i1}c", f"1.0+{i2}c", 'to_right')
-                self._add_merge_buttons(self.merge_button_frame, op_idx, f"1.0+{j1}c", f"1.0+{j2}c", 'to_left')
-
+        # Highlighting and merge arrows are drawn by _render_visible()
         self.text_widget1.configure(state="disabled")
         self.text_widget2.configure(state="disabled")
-
-    def _on_merge(self, direction, op_idx):
+        self._schedule_render()
+
+    @traced("diff_viewer.display_edit", "render")
+    def display_edit(self, side, start, end, new_text):
+        """
+        Replaces the character range start..end of one pane with new_text.
+
+        Used for merges and for undoing them; self.opcodes must already
+        describe the texts after the edit.
+        """
+        widget = self.text_widget1 if side == 1 else self.text_widget2
+        line_index = self.line_index1 if side == 1 else self.line_index2
+        widget.configure(state="normal")
+        widget.delete(line_index.index(start), line_index.index(end))
+        widget.insert(line_index.index(start), new_text)
+        widget.configure(state="disabled")
+        line_index.replace(start, end, new_text)
+        self.alignment = None
+        self._schedule_render()
+
+    def refresh(self):
+        """Redraws the highlights and merge arrows after self.opcodes changed without an edit of the texts."""
+        self.alignment = None
+        self._schedule_render()
+
+    def _on_merge(self, direction, op_indices):
+        # The owner applies each merge to its texts and to self.opcodes, then
+        # calls display_edit() to update just the affected hunk. Entry
+        # indices stay valid across merges, so the hunks of one arrow can be
+        # merged one after another.
         if self.merge_callback:
-            # Get the opcodes for the current diff
-            tag, i1, i2, j1, j2 = self.opcodes[op_idx]
-
-            if direction == 'to_right':  # Merge from left to right (File 1 to File 2)
-                # Replace the content in text2 with content from text1
-                # This is a simplified merge, a real merge would be more complex
-                new_text2 = list(self.original_text2)
-                new_text2[j1:j2] = list(self.original_text1[i1:i2])
-                self.original_text2 = "".join(new_text2)
-                self.merge_callback(self.original_text1, self.original_text2)
-            elif direction == 'to_left':  # Merge from right to left (File 2 to File 1)
-                # Replace the content in text1 with content from text2
-                new_text1 = list(self.original_text1)
-                new_text1[i1:i2] = list(self.original_text2[j1:j2])
-                self.original_text1 = "".join(new_text1)
-                self.merge_callback(self.original_text1, self.original_text2)
-
-            # Re-display the diff with the updated texts
-            from character_differ import get_character_diffs
-            new_opcodes = get_character_diffs(self.original_text1, self.original_text2)
-            self.display_diff(self.original_text1, self.original_text2, new_opcodes)
-
-    def _add_merge_buttons(self, parent_frame, op_idx, start_index, end_index, direction):
-        # Create a frame for the button to control its placement
-        button_container = ctk.CTkFrame(parent_frame, fg_color="transparent")
-        button_container.pack(fill="x", pady=1) # Use pack for vertical stacking in the merge_button_frame
-
-        arrow = "→" if direction == 'to_right' else "←"
-        button = ctk.CTkButton(button_container, text=arrow, width=30, font=self.font,
-                               command=lambda d=direction, i=op_idx: self._on_merge(d, i))
-        button.pack(side="top", padx=5, pady=5)
+            for op_idx in op_indices:
+                self.merge_callback(direction, op_idx)
@@ -0,0 +1,197 @@
+import bisect
+import mmap
+import os
+from array import array
+from itertools import accumulate
+
+from perf_trace import traced
+
+# Bytes scanned per step while building the line index.
+INDEX_CHUNK_BYTES = 4 * 1024 * 1024
+# Approximate number of bytes decoded per chunk when streaming text.
+TEXT_CHUNK_BYTES = 256 * 1024
+
+class MappedFile:
+    """
+    A read-only, memory-mapped text file.
+
+    The line-offset index is built lazily in chunks, straight from the mapped
+    bytes, and text is decoded only for the line ranges that are asked for.
+    Line endings are normalized to '\\n' on decoding, like reading the file
+    in text mode would.
+    """
+
+    def __init__(self, path, encoding='utf-8'):
+        self.path = path
+        self.encoding = encoding
+        self.size = os.path.getsize(path)
+        self._file = open(path, 'rb')
+        # mmap cannot map empty files; an empty bytes object serves the same reads.
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self._line_starts = array('q', [0])
+        self._indexed_to = 0
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _index_more(self):
+        """Extends the line index by one chunk; returns False once the whole file is indexed."""
+        if self._indexed_to >= self.size:
+            return False
+        start = self._indexed_to
+        chunk = self._buffer[start:start + INDEX_CHUNK_BYTES]
+        parts = chunk.split(b'\n')
+        # Every part but the last ends with a newline, so the next line starts one byte after it.
+        starts = accumulate(map((1).__add__, map(len, parts[:-1])), initial=start)
+        next(starts)
+        self._line_starts.extend(starts)
+        self._indexed_to = start + len(chunk)
+        return True
+
+    def ensure_lines(self, count):
+        """Indexes the file until at least count lines are known (or the file ends)."""
+        while len(self._line_starts) < count and self._index_more():
+            pass
+
+    @property
+    def line_count(self):
+        """Number of lines, counting the (possibly empty) line after a trailing newline."""
+        while self._index_more():
+            pass
+        return len(self._line_starts)
+
+    def line_offset(self, line):
+        """Returns the byte offset at which a 0-based line starts, or the file size past the end."""
+        self.ensure_lines(line + 1)
+        if line < len(self._line_starts):
+            return self._line_starts[line]
+        return self.size
+
+    def data(self, start, end):
+        """Returns the raw bytes between two byte offsets, clamped to the file."""
+        return self._buffer[max(start, 0):end]
+
+    def line_bytes(self, line):
+        """Returns the raw bytes of one line, including its terminator."""
+        return self._buffer[self.line_offset(line):self.line_offset(line + 1)]
+
+    def text(self, first_line, last_line):
+        """Decodes lines first_line..last_line (exclusive) into a string."""
+        data = self._buffer[self.line_offset(first_line):self.line_offset(last_line)]
+        return data.decode(self.encoding).replace('\r\n', '\n')
+
+    def iter_text(self, first_line=0, last_line=None, chunk_bytes=TEXT_CHUNK_BYTES):
+        """
+        Yields the decoded text of a line range in chunks of whole lines.
+
+        Chunks end on line boundaries, so multi-byte characters and '\\r\\n'
+        pairs are never split between chunks.
+        """
+        line = first_line
+        while last_line is None or line < last_line:
+            offset = self.line_offset(line)
+            if offset >= self.size:
+                return
+            target = offset + chunk_bytes
+            while self._indexed_to < target and self._index_more():
+                pass
+            # The chunk ends before the first line that starts at or after the target size.
+            end_line = max(line + 1, bisect.bisect_left(self._line_starts, target))
+            if last_line is not None:
+                end_line = min(end_line, last_line)
+            yield self.text(line, end_line)
+            line = end_line
+
+    def read_text(self):
+        """Decodes the whole file."""
+        return self.text(0, self.line_count)
+
+    def line_keys(self, checkpoint=None):
+        """
+        Returns one hash per line, computed from the mapped bytes without decoding.
+
+        '\\r\\n' endings hash like '\\n' so that only real content differences
+        show up. Equal hashes must still be confirmed by comparing the text.
+        """
+        count = self.line_count
+        starts = self._line_starts
+        buffer = self._buffer
+        keys = []
+        for line in range(count):
+            data = buffer[starts[line]:starts[line + 1] if line + 1 < count else self.size]
+            if data.endswith(b'\r\n'):
+                data = data[:-2] + b'\n'
+            keys.append(hash(data))
+            if checkpoint and not line & 0xFFFF:
+                checkpoint()
+        return keys
+
+@traced("file_loader.read_text", "io")
+def read_text(path, encoding='utf-8'):
+    """Reads a whole text file through a memory map."""
+    with MappedFile(path, encoding) as mapped:
+        return mapped.read_text()
+
+class ChunkedLoader:
+    """
+    Streams a MappedFile into a text widget from timer callbacks.
+
+    The first chunk is inserted immediately so the first screen appears
+    right away; the rest follows one chunk per event-loop turn, keeping the
+    window responsive while large files load. on_done is always called from
+    a later callback (or from finish()), never from the constructor, so the
+    caller can store the loader before it completes, even for an empty file.
+    """
+
+    def __init__(self, widget, path, encoding='utf-8', on_done=None, chunk_bytes=TEXT_CHUNK_BYTES):
+        self.widget = widget
+        self.on_done = on_done
+        self.done = False
+        self._mapped = MappedFile(path, encoding)
+        self._chunks = self._mapped.iter_text(chunk_bytes=chunk_bytes)
+        chunk = next(self._chunks, None)
+        if chunk is not None:
+            self._insert(chunk)
+        self._after_id = self.widget.after(1, self._insert_next)
+
+    @traced("file_loader.insert_chunk", "io")
+    def _insert(self, chunk):
+        self.widget.insert("end-1c", chunk)
+
+    def _insert_next(self):
+        self._after_id = None
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._mapped.close()
+            self.done = True
+            if self.on_done:
+                self.on_done()
+            return
+        self._insert(chunk)
+        self._after_id = self.widget.after(1, self._insert_next)
+
+    def finish(self):
+        """Inserts everything that is still pending right away, e.g. before the widget is saved."""
+        if self.done:
+            return
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+        for chunk in self._chunks:
+            self._insert(chunk)
+        self._chunks = iter(())
+        self._insert_next()
+
+    def cancel(self):
+        """Stops loading, e.g. when the tab is closed before the file finished streaming."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+            self._mapped.close()
@@ -0,0 +1,50 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from perf_trace import traced
+from text_buffer import TextBuffer
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+def file_signature(path):
+    """Returns (mtime_ns, size, inode) of a file, which changes whenever the file is written or replaced."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+def file_digest(path):
+    """Returns a content digest of a file, read in chunks."""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+@traced("file_utils.write_text_atomic", "io")
+def write_text_atomic(path, text, encoding='utf-8'):
+    """
+    Writes text to path through a temporary file in the same directory.
+
+    text may be a string or a TextBuffer, which is written piece by piece
+    without being joined into one string first. The file is replaced in a
+    single os.replace(), so a crash leaves either the old or the new
+    contents, never a half-written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as f:
+            if isinstance(text, TextBuffer):
+                f.writelines(text.chunks())
+            else:
+                f.write(text)
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,294 @@
+import queue
+import threading
+from array import array
+from collections import namedtuple
+
+from file_loader import MappedFile
+from file_utils import file_signature
+
+# How often the watched files are stat()ed.
+POLL_INTERVAL_MS = 1000
+# How often finished work of the watcher thread is picked up while some is pending.
+DELIVERY_INTERVAL_MS = 50
+# Size of each block that is compared to tell an append from other changes.
+PROBE_BYTES = 4096
+# Number of blocks spread evenly over the old contents that must still match
+# for a grown file to count as appended to, besides the block at its old end.
+SAMPLE_BLOCKS = 16
+
+# Lines first_line..last_line (exclusive) of the previous contents were
+# replaced by text, which is decoded with '\n' line endings.
+FileChange = namedtuple("FileChange", "path first_line last_line text")
+
+def _line_keys(data):
+    """Hashes the lines of a bytes object the way MappedFile.line_keys() does."""
+    parts = data.split(b'\n')
+    keys = array('q')
+    for part in parts[:-1]:
+        keys.append(hash((part[:-1] if part.endswith(b'\r') else part) + b'\n'))
+    keys.append(hash(parts[-1]))
+    return keys
+
+def _samples(mapped, size):
+    """Hashes the sample blocks of the first size bytes of a MappedFile: evenly spread ones and the last one."""
+    offsets = {block * size // SAMPLE_BLOCKS for block in range(SAMPLE_BLOCKS)}
+    offsets.add(max(0, size - PROBE_BYTES))
+    return [hash(mapped.data(offset, min(offset + PROBE_BYTES, size))) for offset in sorted(offsets)]
+
+class _WatchedFile:
+    """What is known about a watched file: its stat signature, line hashes and sample block hashes."""
+
+    def __init__(self, path, encoding):
+        self.path = path
+        self.encoding = encoding
+        self.callbacks = []
+        # Callbacks that already hold the contents with a given signature; see FileWatcher.check().
+        self.seen = {}
+        # None until the first snapshot has been taken.
+        self.signature = None
+
+    def snapshot(self):
+        """Records the current contents as the baseline for the next comparison."""
+        signature = file_signature(self.path)
+        with MappedFile(self.path, self.encoding) as mapped:
+            self._record(mapped, array('q', mapped.line_keys()))
+        self.signature = signature
+
+    def _record(self, mapped, keys):
+        self.keys = keys
+        self.last_line_offset = mapped.line_offset(len(keys) - 1)
+        self.size = mapped.size
+        self.samples = _samples(mapped, self.size)
+
+    def changed(self):
+        """True if the file's stat signature differs from the baseline; a missing file counts as unchanged."""
+        try:
+            return file_signature(self.path) != self.signature
+        except OSError:
+            return False
+
+    def diff(self):
+        """
+        Compares the file with the baseline, makes it the new baseline and returns the FileChange, or None.
+
+        A file that grew and whose sample blocks up to its old size still
+        match the baseline was appended to; its new lines are decoded from
+        its old last line onwards, so an append costs a few kilobytes of
+        reads plus the new bytes however large the file is. An edit of the
+        old contents that misses every sample block while the file grows is
+        reported with the next change that is not an append. Otherwise the
+        lines of the new contents are hashed straight from a memory map and
+        compared with the baseline hashes from both ends, and only the lines
+        between the common prefix and suffix are decoded.
+        """
+        signature = file_signature(self.path)
+        first_line = len(self.keys) - 1
+        with MappedFile(self.path, self.encoding) as mapped:
+            if mapped.size > self.size and _samples(mapped, self.size) == self.samples:
+                data = mapped.data(self.last_line_offset, mapped.size)
+                text = data.decode(self.encoding).replace('\r\n', '\n')
+                self.keys[first_line:] = _line_keys(data)
+                self.last_line_offset += len(data) - len(data.rsplit(b'\n', 1)[-1])
+                self.size = mapped.size
+                self.samples = _samples(mapped, self.size)
+                self.signature = signature
+                return FileChange(self.path, first_line, first_line + 1, text)
+
+            old_keys = self.keys
+            new_keys = array('q', mapped.line_keys())
+            limit = min(len(old_keys), len(new_keys))
+            prefix = 0
+            while prefix < limit and old_keys[prefix] == new_keys[prefix]:
+                prefix += 1
+            suffix = 0
+            while (suffix < limit - prefix
+                   and old_keys[len(old_keys) - 1 - suffix] == new_keys[len(new_keys) - 1 - suffix]):
+                suffix += 1
+            text = mapped.text(prefix, len(new_keys) - suffix)
+            self._record(mapped, new_keys)
+        self.signature = signature
+        if prefix == len(old_keys) == len(new_keys):
+            # Touched or rewritten with the same contents.
+            return None
+        return FileChange(self.path, prefix, len(old_keys) - suffix, text)
+
+class FileWatcher:
+    """
+    Polls files for changes made by other programs.
+
+    Baselines, polls and diffs all run on a worker thread, one at a time
+    and in the order they were asked for, so watching a large file or
+    reading a large change never blocks the Tk thread. A poll is a stat()
+    per file; only a file whose modification time, size or inode changed
+    is read, and then only as much of it as needed to find the changed
+    lines (see _WatchedFile.diff()). Results are picked up by a Tk timer,
+    so callbacks run on the Tk thread. They receive a FileChange describing
+    the changed line range relative to the contents they last saw, so they
+    can patch their copy in place instead of reloading the file.
+    """
+
+    def __init__(self, widget, interval=POLL_INTERVAL_MS, encoding='utf-8'):
+        self.widget = widget
+        self.interval = interval
+        self.encoding = encoding
+        self._files = {}
+        self._after_id = None
+        self._polling = False
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._pending = 0
+        self._delivery_id = None
+        self._worker = None
+
+    def watch(self, path, callback):
+        """
+        Calls callback(change) whenever the file at path changes.
+
+        If the file is not watched yet, its baseline is taken from its
+        contents on the worker thread shortly after this returns; changes
+        are looked for once it exists. Watching an unreadable file does
+        nothing.
+        """
+        watched = self._files.get(path)
+        if watched is None:
+            watched = self._files[path] = _WatchedFile(path, self.encoding)
+            self._submit(lambda: self._take_snapshot(watched))
+        if callback not in watched.callbacks:
+            watched.callbacks.append(callback)
+        self._schedule_poll()
+
+    def unwatch(self, path, callback):
+        """Stops reporting changes of path to callback."""
+        watched = self._files.get(path)
+        if watched is None or callback not in watched.callbacks:
+            return
+        watched.callbacks.remove(callback)
+        watched.seen.pop(callback, None)
+        if not watched.callbacks:
+            del self._files[path]
+        if not self._files and self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    def check(self, path, exclude=None):
+        """
+        Looks for a change of one file without waiting for the next poll.
+
+        Pass the caller's own callback as exclude after writing the file
+        yourself: the other callbacks still hear about the new contents,
+        but the writer, whose copy already matches them, does not, even if
+        a poll that was already running finds the change first.
+        """
+        watched = self._files.get(path)
+        if watched is None:
+            return
+        if exclude is not None:
+            try:
+                watched.seen[exclude] = file_signature(path)
+            except OSError:
+                pass
+        self._submit(lambda: self._diff_files([watched]))
+
+    def signature(self, path):
+        """
+        Returns the stat signature (see file_signature()) of the contents the baseline of path was taken from.
+
+        None if path is not watched or its baseline is not taken yet; see
+        after_pending().
+        """
+        watched = self._files.get(path)
+        return None if watched is None else watched.signature
+
+    def after_pending(self, callback):
+        """Calls callback on the Tk thread once all work asked for so far is done, e.g. baselines of files just watched."""
+        self._submit(lambda: callback)
+
+    def _take_snapshot(self, watched):
+        # Runs on the worker thread.
+        try:
+            watched.snapshot()
+        except OSError:
+            return lambda: self._forget(watched)
+        return None
+
+    def _forget(self, watched):
+        if self._files.get(watched.path) is watched:
+            del self._files[watched.path]
+
+    def _diff_files(self, watched_files, poll=False):
+        # Runs on the worker thread; the changes are reported on the Tk thread.
+        changes = []
+        for watched in watched_files:
+            # A file whose first snapshot failed has no baseline to compare with.
+            if watched.signature is None or not watched.changed():
+                continue
+            try:
+                change = watched.diff()
+            except (OSError, ValueError):
+                # Replaced between stat() and open(), or not decodable; the next poll retries.
+                continue
+            if change is not None:
+                changes.append((watched, change, watched.signature))
+        return lambda: self._report(changes, poll)
+
+    def _report(self, changes, poll):
+        for watched, change, signature in changes:
+            for callback in list(watched.callbacks):
+                if self._files.get(watched.path) is not watched:
+                    break
+                if watched.seen.get(callback) == signature:
+                    del watched.seen[callback]
+                    continue
+                callback(change)
+        if poll:
+            self._polling = False
+            self._schedule_poll()
+
+    def _schedule_poll(self):
+        if self._files and self._after_id is None and not self._polling:
+            self._after_id = self.widget.after(self.interval, self._poll)
+
+    def _poll(self):
+        # The next poll is scheduled once this one is done, so slow diffs never pile polls up.
+        self._after_id = None
+        self._polling = True
+        watched_files = list(self._files.values())
+        self._submit(lambda: self._diff_files(watched_files, poll=True))
+
+    def _submit(self, job):
+        """Runs job() on the worker thread; the callable it returns, if any, is then called on the Tk thread."""
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run_jobs, daemon=True)
+            self._worker.start()
+        self._pending += 1
+        self._jobs.put(job)
+        if self._delivery_id is None:
+            self._delivery_id = self.widget.after(DELIVERY_INTERVAL_MS, self._deliver)
+
+    def _run_jobs(self):
+        while True:
+            job = self._jobs.get()
+            self._results.put(job())
+
+    def _deliver(self):
+        self._delivery_id = None
+        while True:
+            try:
+                report = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if report is not None:
+                report()
+        if self._pending and self._delivery_id is None:
+            self._delivery_id = self.widget.after(DELIVERY_INTERVAL_MS, self._deliver)
+
+    def stop(self):
+        """Stops polling and forgets every watched file; work already queued is discarded."""
+        for after_id in (self._after_id, self._delivery_id):
+            if after_id is not None:
+                self.widget.after_cancel(after_id)
+        self._after_id = None
+        self._delivery_id = None
+        self._polling = False
+        self._files.clear()
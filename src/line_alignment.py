@@ -0,0 +1,66 @@
+import bisect
+from array import array
+
+class LineAlignment:
+    """
+    A monotone, piecewise-linear map between the line numbers of two diffed texts.
+
+    Anchors are pairs of corresponding lines taken from the boundaries of
+    equal runs, non-decreasing on both sides. Inside an equal run the map
+    has slope 1, so unchanged lines line up exactly; across a change it
+    interpolates between the surrounding anchors, and lines inserted on one
+    side only are skipped over by the other. Lookups in either direction
+    are a binary search over the anchors.
+    """
+
+    def __init__(self, lines1=(0,), lines2=(0,)):
+        self.lines1 = array('q', lines1)
+        self.lines2 = array('q', lines2)
+
+    @classmethod
+    def from_opcodes(cls, opcodes, line_index1, line_index2):
+        """
+        Builds the alignment from character opcodes and the LineIndex of each text.
+
+        Only equal runs become anchors, and an anchor is dropped if it would
+        move backwards on either side, which keeps the map monotone.
+        """
+        alignment = cls()
+        lines1, lines2 = alignment.lines1, alignment.lines2
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag != 'equal':
+                continue
+            for a, b in ((line_index1.line_of(i1), line_index2.line_of(j1)),
+                         (line_index1.line_of(i2), line_index2.line_of(j2))):
+                if a >= lines1[-1] and b >= lines2[-1] and (a > lines1[-1] or b > lines2[-1]):
+                    lines1.append(a)
+                    lines2.append(b)
+        # The ends of both texts always correspond; they lie past every line start.
+        lines1.append(len(line_index1))
+        lines2.append(len(line_index2))
+        return alignment
+
+    def __len__(self):
+        return len(self.lines1)
+
+    def map(self, line, side=1):
+        """
+        Maps a (possibly fractional) 0-based line of one text to the other.
+
+        Args:
+            line: Line position in the source text.
+            side: 1 to map from the first text to the second, 2 for the reverse.
+
+        Returns:
+            The corresponding fractional line position in the other text.
+        """
+        source, target = (self.lines1, self.lines2) if side == 1 else (self.lines2, self.lines1)
+        # Among anchors with the same source line, the last one wins, so a
+        # line just past a one-sided insertion maps below the inserted lines.
+        k = bisect.bisect_right(source, line) - 1
+        if k < 0:
+            return float(target[0])
+        if k >= len(source) - 1:
+            return float(target[-1])
+        span = source[k + 1] - source[k]
+        return target[k] + (line - source[k]) * (target[k + 1] - target[k]) / span
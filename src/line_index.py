@@ -0,0 +1,49 @@
+import bisect
+from itertools import accumulate
+
+class LineIndex:
+    """
+    Maps between character offsets and line numbers of a text.
+
+    Keeps the offset at which every line starts, so converting a character
+    offset to a Tk "line.column" index is a binary search instead of Tk
+    walking "1.0+Nc" from the start of the widget.
+    """
+
+    def __init__(self, starts=(0,)):
+        self.starts = list(starts)
+
+    @classmethod
+    def from_text(cls, text):
+        """Builds the index for a string, splitting lines on '\\n' like Tk does."""
+        starts = list(accumulate((len(line) + 1 for line in text.split('\n')), initial=0))
+        starts.pop()
+        return cls(starts)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def line_of(self, offset):
+        """Returns the 0-based line containing a character offset."""
+        return bisect.bisect_right(self.starts, offset) - 1
+
+    def offset_of(self, line):
+        """Returns the character offset at which a 0-based line starts, clamped to the last line."""
+        return self.starts[min(max(line, 0), len(self.starts) - 1)]
+
+    def index(self, offset):
+        """Converts a character offset into a Tk text index."""
+        line = self.line_of(offset)
+        return f"{line + 1}.{offset - self.starts[line]}"
+
+    def replace(self, start, end, new_text):
+        """Updates the index after text[start:end] was replaced with new_text."""
+        starts = self.starts
+        k1 = bisect.bisect_right(starts, start)
+        k2 = bisect.bisect_right(starts, end)
+        new_starts = [start + i + 1 for i, char in enumerate(new_text) if char == '\n']
+        starts[k1:k2] = new_starts
+        delta = len(new_text) - (end - start)
+        if delta:
+            k = k1 + len(new_starts)
+            starts[k:] = [s + delta for s in starts[k:]]
@@ -1,11 +1,32 @@
-import customtkinter as ctk
-import os
-import sys
-import tkinter as tk
-from tkinter import filedialog
-from character_differ import get_character_diffs
-from diff_viewer import DiffViewer
-from ui_components import TextEditorWithLineNumbers
+import time
+# Taken before the other imports so that startup tracing includes them;
+# the imports below are deliberately not at the top of the file (E402).
+_START_TIME = time.perf_counter()
+
+import customtkinter as ctk  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+import tkinter as tk  # noqa: E402
+from collections import OrderedDict  # noqa: E402
+from tkinter import filedialog, messagebox  # noqa: E402
+from file_loader import ChunkedLoader  # noqa: E402
+from file_watcher import FileWatcher  # noqa: E402
+import perf_trace  # noqa: E402
+from session_store import load_session, save_session  # noqa: E402
+from ui_components import PerfStatsWindow, TextEditorWithLineNumbers  # noqa: E402
+# The diff engine, cache, service and viewer modules are imported when the
+# comparison view is first needed, keeping them off the startup path.
+
+# Set to log startup milestones, including time to first paint, to stderr.
+STARTUP_TRACE_ENV = "DIFFNOTE_STARTUP_TRACE"
+
+# Characters of text that loaded tabs may hold in total; beyond this, the
+# least recently used background tabs without unsaved edits are unloaded.
+TAB_MEMORY_BUDGET = 32 * 1024 * 1024
+
+def _log_startup(stage):
+    if os.environ.get(STARTUP_TRACE_ENV):
+        print(f"[startup] {stage}: {(time.perf_counter() - _START_TIME) * 1000:.1f} ms", file=sys.stderr)
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -19,6 +40,7 @@ def resource_path(relative_path):
 
 class TextDiffApp(ctk.CTk):
     def __init__(self):
+        _log_startup("imports done")
         super().__init__()
 
         ctk.set_default_color_theme(resource_path("theme.json"))
@@ -38,10 +60,32 @@ class TextDiffApp(ctk.CTk):
         self.main_content.grid_rowconfigure(0, weight=1)
         self.main_content.grid_columnconfigure(0, weight=1)
 
+        # Created by _ensure_comparison_view() on the first comparison.
+        self.diff_service = None
+        self.diff_viewer = None
+        self.merge_session = None
+        self.stats_window = None
+        self.file1_path = None
+        self.file2_path = None
+
+        # Open tabs and compared files are polled for changes made by other programs.
+        self.file_watcher = FileWatcher(self)
+
         self._create_editor_view()
-        self._create_comparison_view()
 
         self.show_editor_view()
+        # Closing the window goes through destroy() so the session is saved and merges are flushed.
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+        _log_startup("window built")
+        if os.environ.get(STARTUP_TRACE_ENV):
+            self._first_paint_logged = False
+            self.bind("<Map>", self._on_first_map, add=True)
+
+    def _on_first_map(self, event):
+        if event.widget is self and not self._first_paint_logged:
+            self._first_paint_logged = True
+            # Redrawing happens in idle callbacks queued by the map, so this runs after it.
+            self.after_idle(_log_startup, "first paint")
 
     def _create_editor_view(self):
         self.editor_frame = ctk.CTkFrame(self.main_content, fg_color="transparent")
@@ -51,16 +95,23 @@ class TextDiffApp(ctk.CTk):
 
         # The editor toolbar has been replaced by the main menu bar.
 
-        self.tab_view = ctk.CTkTabview(self.editor_frame, anchor="w") # Align tabs to the left
+        self.tab_view = ctk.CTkTabview(self.editor_frame, anchor="w", command=self._on_tab_changed) # Align tabs to the left
         self.tab_view.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
 
-        # Data structures to manage tabs
+        # Data structures to manage tabs. A tab only gets an editor (an
+        # entry in editor_textboxes) once it is shown; until then, and after
+        # being unloaded, it is a placeholder holding its path and view state.
         self.editor_textboxes = {}
         self.tab_filepaths = {}
+        self.tab_loaders = {}
+        self.tab_view_states = {}
+        self.tab_saved_texts = {}
+        self.tab_activity = OrderedDict()
         self.new_file_count = 0
 
         self._create_menu()
-        self.add_new_tab() # Start with a blank tab
+        if not self._restore_session():
+            self.add_new_tab() # Start with a blank tab
 
     def _create_menu(self):
         """Creates the main window menu bar."""
@@ -84,13 +135,44 @@ class TextDiffApp(ctk.CTk):
         tools_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Tools", menu=tools_menu)
         tools_menu.add_command(label="Compare Files...", command=self.start_comparison)
+        tools_menu.add_command(label="Three-Way Merge...", command=self.start_three_way_merge)
+        tools_menu.add_separator()
+        tools_menu.add_command(label="Undo Merge", command=self.undo_merge)
+        tools_menu.add_command(label="Redo Merge", command=self.redo_merge)
+        tools_menu.add_command(label="Save Merged Files", command=self.flush_merges)
+        tools_menu.add_separator()
+        # Tracing starts on when DIFFNOTE_TRACE is set.
+        self.trace_enabled = tk.BooleanVar(self, value=perf_trace.enabled())
+        tools_menu.add_checkbutton(label="Trace Performance", variable=self.trace_enabled,
+                                   command=lambda: perf_trace.enable(self.trace_enabled.get()))
+        tools_menu.add_command(label="Performance Stats", command=self.show_perf_stats)
+        tools_menu.add_command(label="Export Trace...", command=self.export_trace)
+
+    def _ensure_comparison_view(self):
+        """Creates the diff service and the comparison view on first use."""
+        if self.diff_viewer is not None:
+            return
+        from diff_cache import DiffCache, user_cache_dir
+        from diff_service import DiffService
+        self.diff_service = DiffService(self, cache=DiffCache(directory=user_cache_dir()))
+        self._create_comparison_view()
 
     def _create_comparison_view(self):
+        from diff_viewer import DiffViewer
         self.comparison_frame = ctk.CTkFrame(self.main_content, fg_color="transparent")
         self.comparison_frame.grid(row=0, column=0, sticky="nsew")
         self.comparison_frame.grid_rowconfigure(0, weight=1)
         self.comparison_frame.grid_columnconfigure(0, weight=1)
 
+        # Status bar for background diffs; packed first so it keeps its place at the bottom.
+        self.diff_status_frame = ctk.CTkFrame(self.comparison_frame, fg_color="transparent")
+        self.diff_status_frame.pack(side="bottom", fill="x")
+        self.diff_status_label = ctk.CTkLabel(self.diff_status_frame, text="")
+        self.diff_status_label.pack(side="left", padx=10)
+        self.diff_cancel_button = ctk.CTkButton(self.diff_status_frame, text="Cancel", width=80,
+                                                command=self.cancel_comparison)
+        self.diff_progress_bar = ctk.CTkProgressBar(self.diff_status_frame, width=200)
+
         self.diff_viewer = DiffViewer(self.comparison_frame, merge_callback=self._perform_merge)
         self.diff_viewer.pack(fill="both", expand=True)
 
@@ -98,43 +180,125 @@ class TextDiffApp(ctk.CTk):
         self.editor_frame.tkraise()
 
     def show_comparison_view(self):
+        self._ensure_comparison_view()
         self.comparison_frame.tkraise()
 
-    def add_new_tab(self, filepath=None):
-        """Creates a new tab, either for a new file or an existing one."""
+    def add_new_tab(self, filepath=None, activate=True, view_state=None):
+        """
+        Creates a new tab, either for a new file or an existing one.
+
+        Args:
+            filepath: File to show in the tab, or None for an untitled tab.
+            activate: If False, the tab stays a placeholder and the file is
+                not read until the tab is first shown.
+            view_state: Optional (cursor_index, top_line) to restore once
+                the file is loaded.
+        """
         if filepath:
             filename = os.path.basename(filepath)
             # Prevent opening the same file in multiple tabs
             if filepath in self.tab_filepaths.values():
                 for tab_name, f_path in self.tab_filepaths.items():
                     if f_path == filepath:
-                        self.tab_view.set(tab_name)
+                        if activate:
+                            self.tab_view.set(tab_name)
+                            self._on_tab_changed()
                         return
             tab_name = filename
         else:
             self.new_file_count += 1
             tab_name = f"Untitled-{self.new_file_count}"
 
-        tab_frame = self.tab_view.add(tab_name)
-        editor_with_linenumbers = TextEditorWithLineNumbers(tab_frame)
+        self.tab_view.add(tab_name)
+        self.tab_filepaths[tab_name] = filepath
+        if view_state:
+            self.tab_view_states[tab_name] = view_state
+
+        if activate:
+            self.tab_view.set(tab_name)
+            self._on_tab_changed()
+
+    def _on_tab_changed(self):
+        """Loads the newly shown tab if it is a placeholder, then trims background tabs to the budget."""
+        current_tab = self.tab_view.get()
+        if not current_tab:
+            return
+        self._materialize_tab(current_tab)
+        self.tab_activity.pop(current_tab, None)
+        self.tab_activity[current_tab] = None
+        self._enforce_tab_budget()
+
+    def _materialize_tab(self, tab_name):
+        """Builds the editor of a placeholder tab and starts loading its file."""
+        if tab_name in self.editor_textboxes:
+            return self.editor_textboxes[tab_name]
+
+        editor_with_linenumbers = TextEditorWithLineNumbers(self.tab_view.tab(tab_name))
         editor_with_linenumbers.pack(fill="both", expand=True)
 
         textbox = editor_with_linenumbers
 
         self.editor_textboxes[tab_name] = textbox
-        self.tab_filepaths[tab_name] = filepath
 
+        filepath = self.tab_filepaths.get(tab_name)
         if filepath:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                textbox.insert("1.0", f.read())
-
-        self.tab_view.set(tab_name)
+            # Stream the file in from a memory map so large files show their
+            # first screen immediately and never exist as one Python string.
+            self.tab_loaders[tab_name] = ChunkedLoader(
+                textbox, filepath, on_done=lambda name=tab_name: self._on_tab_loaded(name))
+        else:
+            self.tab_saved_texts[tab_name] = textbox.snapshot()
+        return textbox
+
+    def _on_tab_loaded(self, tab_name):
+        self.tab_loaders.pop(tab_name, None)
+        editor = self.editor_textboxes[tab_name]
+        self.tab_saved_texts[tab_name] = editor.snapshot()
+        self.file_watcher.watch(self.tab_filepaths[tab_name], self._on_tab_file_changed)
+        view_state = self.tab_view_states.pop(tab_name, None)
+        if view_state:
+            cursor, top_line = view_state
+            editor.textbox.mark_set("insert", cursor)
+            editor.textbox.yview(f"{top_line}.0")
+
+    def _tab_view_state(self, tab_name):
+        """Returns (cursor_index, top_line) of a tab, whether it is loaded or a placeholder."""
+        editor = self.editor_textboxes.get(tab_name)
+        if editor is None or tab_name in self.tab_loaders:
+            return self.tab_view_states.get(tab_name, ("1.0", 1))
+        return editor.textbox.index("insert"), int(editor.textbox.index("@0,0").split(".")[0])
+
+    def _can_unload(self, tab_name):
+        """A tab can be unloaded if its file can be read back and it has no unsaved edits."""
+        editor = self.editor_textboxes.get(tab_name)
+        saved = self.tab_saved_texts.get(tab_name)
+        return (editor is not None and self.tab_filepaths.get(tab_name) and tab_name not in self.tab_loaders
+                and saved is not None and editor.buffer.same_version(saved))
+
+    def _unload_tab(self, tab_name):
+        """Turns a loaded tab back into a placeholder, remembering its cursor and scroll position."""
+        self.tab_view_states[tab_name] = self._tab_view_state(tab_name)
+        self.file_watcher.unwatch(self.tab_filepaths[tab_name], self._on_tab_file_changed)
+        self.editor_textboxes.pop(tab_name).destroy()
+        self.tab_saved_texts.pop(tab_name, None)
+
+    def _enforce_tab_budget(self):
+        total = sum(len(editor.buffer) for editor in self.editor_textboxes.values())
+        current_tab = self.tab_view.get()
+        # tab_activity runs from least to most recently shown.
+        for tab_name in list(self.tab_activity):
+            if total <= TAB_MEMORY_BUDGET:
+                break
+            if tab_name != current_tab and self._can_unload(tab_name):
+                total -= len(self.editor_textboxes[tab_name].buffer)
+                self._unload_tab(tab_name)
 
     def open_file(self):
         """Opens one or more files in new tabs."""
         filepaths = filedialog.askopenfilenames()
-        for filepath in filepaths:
-            self.add_new_tab(filepath=filepath)
+        # Only the last file is shown and read now; the others load when their tab is first opened.
+        for i, filepath in enumerate(filepaths):
+            self.add_new_tab(filepath=filepath, activate=i == len(filepaths) - 1)
 
     def save_file(self):
         """Saves the content of the currently active tab."""
@@ -142,11 +306,16 @@ class TextDiffApp(ctk.CTk):
         if not current_tab:
             return
 
+        self._finish_loading(current_tab)
         filepath = self.tab_filepaths.get(current_tab)
         if filepath:
-            content = self.editor_textboxes[current_tab].get("1.0", "end-1c")
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(content)
+            editor = self.editor_textboxes[current_tab]
+            with perf_trace.span("main_app.save_file", "io"), open(filepath, "w", encoding="utf-8") as f:
+                f.write(editor.widget_text())
+            # widget_text() realigned the buffer, so this snapshot matches what was written.
+            self.tab_saved_texts[current_tab] = editor.snapshot()
+            # A comparison of this file picks up the saved text; the tab already has it.
+            self.file_watcher.check(filepath, exclude=self._on_tab_file_changed)
         else:
             self.save_file_as()
 
@@ -164,17 +333,42 @@ class TextDiffApp(ctk.CTk):
         if not new_filepath:
             return
 
-        content = self.editor_textboxes[current_tab].get("1.0", "end-1c")
+        self._finish_loading(current_tab)
+        content = self.editor_textboxes[current_tab].widget_text()
         with open(new_filepath, "w", encoding="utf-8") as f:
             f.write(content)
 
         # Workaround for no tab rename: close old, open new
-        textbox_content = self.editor_textboxes[current_tab].get("1.0", "end-1c")
         self.close_current_tab(force=True)
         self.add_new_tab(filepath=new_filepath)
+        self._finish_loading(os.path.basename(new_filepath))
         self.editor_textboxes[os.path.basename(new_filepath)].delete("1.0", "end")
-        self.editor_textboxes[os.path.basename(new_filepath)].insert("1.0", textbox_content)
+        self.editor_textboxes[os.path.basename(new_filepath)].insert("1.0", content)
+        self.tab_saved_texts[os.path.basename(new_filepath)] = self.editor_textboxes[os.path.basename(new_filepath)].snapshot()
+
+
+    def _on_tab_file_changed(self, change):
+        """Patches the changed lines into the tab showing a file that changed on disk."""
+        for tab_name, filepath in self.tab_filepaths.items():
+            if filepath == change.path:
+                break
+        else:
+            return
+        editor = self.editor_textboxes.get(tab_name)
+        saved = self.tab_saved_texts.get(tab_name)
+        if editor is None or saved is None or not editor.buffer.same_version(saved):
+            # Unsaved edits win; the tab no longer matches the file, so it is not unloaded either.
+            self.tab_saved_texts.pop(tab_name, None)
+            return
+        editor.delete(f"{change.first_line + 1}.0", f"{change.last_line + 1}.0")
+        editor.insert(f"{change.first_line + 1}.0", change.text)
+        self.tab_saved_texts[tab_name] = editor.snapshot()
 
+    def _finish_loading(self, tab_name):
+        """Completes a tab's background file load so its widget holds the whole file."""
+        loader = self.tab_loaders.get(tab_name)
+        if loader:
+            loader.finish()
 
     def close_current_tab(self, force=False):
         """Closes the currently active tab."""
@@ -184,13 +378,54 @@ class TextDiffApp(ctk.CTk):
 
         # In a real app, we'd check for unsaved changes here.
 
-        self.tab_view.delete(current_tab)
-        del self.editor_textboxes[current_tab]
+        loader = self.tab_loaders.pop(current_tab, None)
+        if loader:
+            loader.cancel()
         if self.tab_filepaths.get(current_tab):
-            del self.tab_filepaths[current_tab]
+            self.file_watcher.unwatch(self.tab_filepaths[current_tab], self._on_tab_file_changed)
+        self.tab_view.delete(current_tab)
+        self.editor_textboxes.pop(current_tab, None)
+        self.tab_filepaths.pop(current_tab, None)
+        self.tab_view_states.pop(current_tab, None)
+        self.tab_saved_texts.pop(current_tab, None)
+        self.tab_activity.pop(current_tab, None)
 
         if len(self.tab_view._name_list) == 0:
             self.add_new_tab()
+        else:
+            # The tab view selects a neighbour, which may still be a placeholder.
+            self._on_tab_changed()
+
+    def _restore_session(self):
+        """
+        Reopens the tabs of the last session as placeholders.
+
+        Only the active tab's file is read; the rest load when first shown.
+        Returns False if there was nothing to restore.
+        """
+        session = load_session()
+        tabs = [tab for tab in session["tabs"] if os.path.isfile(tab["path"])]
+        for tab in tabs:
+            self.add_new_tab(tab["path"], activate=False,
+                             view_state=(tab.get("cursor", "1.0"), tab.get("top_line", 1)))
+        if not tabs:
+            return False
+        active = session["active"] if session["active"] in (tab["path"] for tab in tabs) else tabs[-1]["path"]
+        self.add_new_tab(active)
+        return True
+
+    def _save_session(self):
+        """Records open files with their cursor and scroll positions; untitled tabs are not kept."""
+        tabs = []
+        for tab_name in self.tab_view._name_list:
+            filepath = self.tab_filepaths.get(tab_name)
+            if filepath:
+                cursor, top_line = self._tab_view_state(tab_name)
+                tabs.append({"path": filepath, "cursor": cursor, "top_line": top_line})
+        try:
+            save_session(tabs, self.tab_filepaths.get(self.tab_view.get()))
+        except OSError:
+            pass
 
     def start_comparison(self):
         """
@@ -204,39 +439,268 @@ class TextDiffApp(ctk.CTk):
         if not file2_path:
             return
 
+        self._compare_files(file1_path, file2_path)
+
+    def _compare_files(self, file1_path, file2_path, message=""):
+        """Reads two files and diffs them in the background; message is shown once the diff is done."""
+        # Pending merges from the previous comparison must reach the disk
+        # before the files are read again.
+        self._close_merge_session()
+        self._watch_compared_files(file1_path, file2_path)
         self.file1_path = file1_path
         self.file2_path = file2_path
 
-        with open(file1_path, 'r', encoding='utf-8') as f:
-            self.text1 = f.read()
-        with open(file2_path, 'r', encoding='utf-8') as f:
-            self.text2 = f.read()
+        self.show_comparison_view()
+        self._show_diff_status()
+        # The service reads the files off the Tk thread and sends the opcodes
+        # back as compact columns rather than millions of tuples.
+        self.diff_service.submit_files(file1_path, file2_path, lambda result: self._on_diff_done(result, message),
+                                       on_progress=self._on_diff_progress, on_error=self._on_diff_error,
+                                       hierarchical=True, compact=True)
+
+    def start_three_way_merge(self):
+        """
+        Prompts for a common ancestor and two edited versions and merges them.
+
+        Non-conflicting changes are applied to both versions at once; the
+        comparison view then shows only the conflicts, which are resolved
+        with the merge arrows as usual.
+        """
+        base_path = filedialog.askopenfilename(title="Select the Common Ancestor")
+        if not base_path:
+            return
+        file1_path = filedialog.askopenfilename(title="Select the First Edited File")
+        if not file1_path:
+            return
+        file2_path = filedialog.askopenfilename(title="Select the Second Edited File")
+        if not file2_path:
+            return
+
+        self._close_merge_session()
+        self._watch_compared_files(file1_path, file2_path)
+        self.file1_path = file1_path
+        self.file2_path = file2_path
 
-        opcodes = get_character_diffs(self.text1, self.text2)
-        self.diff_viewer.display_diff(self.text1, self.text2, opcodes)
         self.show_comparison_view()
+        self._show_diff_status()
+        self.diff_service.submit_merge_files(base_path, file1_path, file2_path, self._on_three_way_done,
+                                             on_progress=self._on_diff_progress, on_error=self._on_diff_error)
+
+    def _on_three_way_done(self, result):
+        self._when_baselines_match(result.signatures[1:], lambda: self._show_three_way_merge(result))
+
+    def _show_three_way_merge(self, result):
+        from merge_session import MergeSession
+        _, text1, text2 = result.texts
+        merge = result.result
+        self._hide_diff_status(f"Applied {merge.applied} change(s) automatically; "
+                               f"{merge.conflicts} conflict(s) left to resolve.")
+        changed = [merge.text1 != text1, merge.text2 != text2]
+        # The session keeps the texts from here on; the viewer only needs them to fill its panes.
+        self.diff_viewer.display_diff(merge.text1, merge.text2, merge.opcodes)
+        self.merge_session = MergeSession(self.file1_path, self.file2_path, merge.text1, merge.text2,
+                                          self.diff_viewer.opcodes, widget=self,
+                                          on_write=self._on_merge_written, on_error=self._on_merge_write_failed)
+        # The automatically merged texts are written back like any other merge.
+        for side, side_changed in enumerate(changed, start=1):
+            if side_changed:
+                self.merge_session.mark_changed(side)
+
+    def _show_diff_status(self):
+        self.diff_progress_bar.set(0)
+        self.diff_progress_bar.pack(side="left", padx=5)
+        self.diff_cancel_button.pack(side="left", padx=5)
+        self.diff_status_label.configure(text="Comparing...")
+
+    def _on_diff_progress(self, done, total):
+        self.diff_progress_bar.set(done / total if total else 1)
+
+    def _on_diff_done(self, result, message=""):
+        self._when_baselines_match(result.signatures, lambda: self._show_comparison(result, message))
+
+    def _when_baselines_match(self, signatures, show):
+        """
+        Calls show() once the watcher's baselines of the compared files match the contents that were diffed.
+
+        The baselines are queued before the files are read, but either may
+        see the files first. If a file changed in between, its later changes
+        would be patched into the wrong text, so the comparison is run again
+        instead.
+        """
+        generation = self.diff_service.generation
+
+        def check():
+            if generation != self.diff_service.generation:
+                # A newer comparison was started meanwhile.
+                return
+            for path, signature in zip((self.file1_path, self.file2_path), signatures):
+                if signature is None or self.file_watcher.signature(path) != signature:
+                    self._compare_files(self.file1_path, self.file2_path,
+                                        f"{os.path.basename(path)} changed while it was compared; compared again.")
+                    return
+            show()
+
+        self.file_watcher.after_pending(check)
+
+    def _show_comparison(self, result, message):
+        from merge_session import MergeSession
+        self._hide_diff_status(message)
+        text1, text2 = result.texts
+        # The session keeps the texts from here on; the viewer only needs them to fill its panes.
+        self.diff_viewer.display_diff(text1, text2, result.result)
+        self.merge_session = MergeSession(self.file1_path, self.file2_path, text1, text2,
+                                          self.diff_viewer.opcodes, widget=self,
+                                          on_write=self._on_merge_written, on_error=self._on_merge_write_failed)
+
+    def _watch_compared_files(self, file1_path, file2_path):
+        for path in {self.file1_path, self.file2_path} - {None}:
+            self.file_watcher.unwatch(path, self._on_compared_file_changed)
+        for path in (file1_path, file2_path):
+            self.file_watcher.watch(path, self._on_compared_file_changed)
+
+    def _show_edit(self, edit):
+        """Shows a TextEdit of the merge session in the viewer."""
+        self.diff_viewer.display_edit(*edit)
+
+    def _on_merge_write_failed(self, path, error):
+        self.diff_status_label.configure(
+            text=f"Could not save {os.path.basename(path)}: {error}. The merges are kept and will be retried.")
+
+    def _on_merge_written(self, path):
+        # A tab showing the file picks up the merge; the comparison already has it.
+        self.file_watcher.check(path, exclude=self._on_compared_file_changed)
+
+    def _on_compared_file_changed(self, change):
+        """
+        Brings the comparison up to date after a compared file changed on disk.
+
+        The changed lines are patched into the session's text right away and
+        shown as one hunk, which the diff service then re-diffs in the
+        background. The whole comparison is re-run instead if a diff is
+        still running, if the file is compared with itself, or if the side
+        has merges that were not written back; those merges are dropped in
+        favour of the file on disk.
+        """
+        name = os.path.basename(change.path)
+        sides = [side for side, path in ((1, self.file1_path), (2, self.file2_path)) if path == change.path]
+        session = self.merge_session
+        if session is None or self.diff_service.busy or len(sides) != 1:
+            self._compare_files(self.file1_path, self.file2_path, f"{name} changed on disk; compared again.")
+            return
+        side = sides[0]
+        if session.is_dirty(side):
+            session.discard(side)
+            self._compare_files(self.file1_path, self.file2_path,
+                                f"{name} changed on disk; unsaved merges to it were discarded.")
+            return
+
+        text = session.texts[side]
+        start, end = text.line_start(change.first_line), text.line_start(change.last_line)
+        edit = session.reload(side, start, end, change.text)
+        index, (lo1, hi1, lo2, hi2) = session.opcodes.mark_edit(side, start, end, len(change.text))
+        self._show_edit(edit)
+        message = f"{name} changed on disk; comparison updated."
+        if index is None:
+            self.diff_status_label.configure(text=message)
+            return
+        # Merges wait for the re-diff like for any running diff.
+        self.diff_service.submit(session.texts[1][lo1:hi1], session.texts[2][lo2:hi2],
+                                 lambda opcodes: self._on_rediff_done(index, opcodes, message),
+                                 on_error=self._on_diff_error, hierarchical=True)
+
+    def _on_rediff_done(self, index, opcodes, message):
+        self.merge_session.opcodes.splice(index, index + 1, opcodes)
+        self.diff_viewer.refresh()
+        self.diff_status_label.configure(text=message)
+
+    def _on_diff_error(self, error):
+        self._hide_diff_status(f"Comparison failed: {error}")
+
+    def _hide_diff_status(self, message):
+        self.diff_progress_bar.pack_forget()
+        self.diff_cancel_button.pack_forget()
+        self.diff_status_label.configure(text=message)
+
+    def cancel_comparison(self):
+        """Cancels a running comparison; the view keeps its previous contents."""
+        self.diff_service.cancel()
+        self._hide_diff_status("Comparison cancelled.")
 
     def _perform_merge(self, direction, op_idx):
         """Applies a change from one file to the other based on character diff opcodes."""
-        opcodes = self.diff_viewer.opcodes
-        _, i1, i2, j1, j2 = opcodes[op_idx]
+        if self.merge_session is None or self.diff_service.busy:
+            # The displayed opcodes are stale until the pending diff completes.
+            return
+
+        # The merged hunk becomes an equal run, so the existing opcodes stay
+        # valid once the following offsets are shifted; no re-diff is needed.
+        # The session writes the changed file back after a short delay.
+        edit = self.merge_session.merge(op_idx, direction)
+        if edit is not None:
+            self._show_edit(edit)
+
+    def undo_merge(self):
+        """Reverts the last merge in the comparison view."""
+        if self.merge_session is None or self.diff_service.busy:
+            return
+        edit = self.merge_session.undo()
+        if edit is not None:
+            self._show_edit(edit)
 
-        if direction == 'to_left':  # Apply change from right to left
-            self.text1 = self.text1[:i1] + self.text2[j1:j2] + self.text1[i2:]
-        elif direction == 'to_right':  # Apply change from left to right
-            self.text2 = self.text2[:j1] + self.text1[i1:i2] + self.text2[j2:]
+    def redo_merge(self):
+        """Re-applies the last undone merge in the comparison view."""
+        if self.merge_session is None or self.diff_service.busy:
+            return
+        edit = self.merge_session.redo()
+        if edit is not None:
+            self._show_edit(edit)
+
+    def flush_merges(self):
+        """Writes pending merges to disk right away."""
+        if self.merge_session is not None:
+            self.merge_session.flush()
+
+    def _close_merge_session(self):
+        session = self.merge_session
+        if session is None:
+            return
+        self.merge_session = None
+        session.close()
+        unsaved = [path for side, path in session.paths.items() if session.is_dirty(side)]
+        if unsaved:
+            messagebox.showerror("Merges Not Saved",
+                                 "These files could not be written, so their merges were lost:\n\n" + "\n".join(unsaved))
+
+    def show_perf_stats(self):
+        """Opens the performance stats window, or raises it if it is already open."""
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        self.stats_window = PerfStatsWindow(self, on_export=self.export_trace)
 
-        # Save the modified content back to the original files
-        with open(self.file1_path, 'w', encoding='utf-8') as f:
-            f.write(self.text1)
-        with open(self.file2_path, 'w', encoding='utf-8') as f:
-            f.write(self.text2)
+    def export_trace(self):
+        """Saves the collected trace events as Chrome trace JSON (chrome://tracing, Perfetto)."""
+        path = filedialog.asksaveasfilename(defaultextension=".json", initialfile="diffnote-trace.json",
+                                            filetypes=[("Trace Files", "*.json"), ("All Files", "*.*")])
+        if not path:
+            return
+        try:
+            perf_trace.export_chrome_trace(path)
+        except OSError as e:
+            messagebox.showerror("Export Failed", f"Could not write the trace to {path}:\n{e}")
 
-        # Rerun the comparison and refresh the view
-        new_opcodes = get_character_diffs(self.text1, self.text2)
-        self.diff_viewer.display_diff(self.text1, self.text2, new_opcodes)
+    def destroy(self):
+        try:
+            self._save_session()
+            self.file_watcher.stop()
+            self._close_merge_session()
+        finally:
+            super().destroy()
 
 
 if __name__ == "__main__":
+    import multiprocessing
+    # Needed for the diff worker processes in a frozen (PyInstaller) build.
+    multiprocessing.freeze_support()
     app = TextDiffApp()
     app.mainloop()
@@ -0,0 +1,201 @@
+from collections import namedtuple
+
+from file_utils import write_text_atomic
+from text_buffer import TextBuffer
+
+# Merged text is written back this long after the last merge.
+FLUSH_DELAY_MS = 1000
+
+# One merge as recorded in the journal: the opcode before the merge and the
+# text it overwrote, which is everything needed to undo it.
+MergeEdit = namedtuple("MergeEdit", "op_idx direction opcode old_text")
+
+# A change to one side's text: text[start:end] was replaced with new_text.
+TextEdit = namedtuple("TextEdit", "side start end new_text")
+
+class MergeSession:
+    """
+    Applies merges between two files in memory and writes them back in batches.
+
+    Every merge is recorded in a journal and marks only the side it changed
+    as dirty. The texts are held in TextBuffers, so a merge costs O(log n)
+    plus the size of the hunk rather than a copy of the file. Dirty sides
+    are written on flush(), which runs on a debounce timer when a widget is
+    given, so a burst of merge clicks costs one write per changed file
+    instead of two full writes per click. Undo and redo
+    replay the journal against the in-memory texts and the opcode model
+    without re-reading or re-diffing the files.
+    """
+
+    def __init__(self, path1, path2, text1, text2, opcodes, widget=None, flush_delay=FLUSH_DELAY_MS,
+                 encoding='utf-8', on_write=None, on_error=None):
+        """
+        Args:
+            path1: Path of the first (left) file.
+            path2: Path of the second (right) file.
+            text1: Current contents of the first file.
+            text2: Current contents of the second file.
+            opcodes: The OpcodeModel describing the diff of the two texts;
+                it is updated in place by merges, undo and redo.
+            widget: Optional Tk widget used to schedule debounced flushes.
+                Without one, nothing is written until flush() is called.
+            flush_delay: Debounce delay in milliseconds.
+            encoding: Encoding used when writing the files.
+            on_write: Optional callback, called with the path of every file
+                the session has written.
+            on_error: Optional callback, called with (path, error) when
+                writing a file fails. The side stays dirty and is retried
+                on the next flush. Without it, the OSError propagates.
+        """
+        self.paths = {1: path1, 2: path2}
+        self.texts = {1: TextBuffer(text1), 2: TextBuffer(text2)}
+        self.opcodes = opcodes
+        self.widget = widget
+        self.flush_delay = flush_delay
+        self.encoding = encoding
+        self.on_write = on_write
+        self.on_error = on_error
+        self._undo = []
+        self._redo = []
+        self._dirty = set()
+        self._flush_id = None
+
+    @property
+    def text1(self):
+        """A snapshot of the first text; see TextBuffer.snapshot()."""
+        return self.texts[1].snapshot()
+
+    @property
+    def text2(self):
+        """A snapshot of the second text."""
+        return self.texts[2].snapshot()
+
+    @property
+    def dirty(self):
+        """True if some merged text has not been written back yet."""
+        return bool(self._dirty)
+
+    def is_dirty(self, side):
+        """True if a side has changes that have not been written back yet."""
+        return side in self._dirty
+
+    def mark_changed(self, side):
+        """Marks a side as differing from its file, e.g. after changes were applied when the session was set up."""
+        self._dirty.add(side)
+        self._schedule_flush()
+
+    def discard(self, side):
+        """Drops the unwritten changes of a side, e.g. because its file was changed by another program."""
+        self._dirty.discard(side)
+
+    def reload(self, side, start, end, new_text):
+        """
+        Replaces text[start:end] of a side with text that changed on disk.
+
+        The file already holds the new text, so the side is not marked
+        dirty. The caller updates self.opcodes. Merges recorded before the
+        change can no longer be undone, since their offsets may be stale.
+
+        Returns:
+            The TextEdit that was applied.
+        """
+        edit = TextEdit(side, start, end, new_text)
+        self.texts[side].replace(start, end, new_text)
+        self._undo.clear()
+        self._redo.clear()
+        return edit
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def merge(self, op_idx, direction):
+        """
+        Merges one hunk in the given direction.
+
+        Args:
+            op_idx: Index of the opcode to merge.
+            direction: 'to_right' to copy the left range over the right one,
+                'to_left' to copy the right range over the left one.
+
+        Returns:
+            The TextEdit that was applied, or None if the hunk is already equal.
+        """
+        edit = self._apply(op_idx, direction)
+        if edit is not None:
+            self._redo.clear()
+        return edit
+
+    def undo(self):
+        """Reverts the most recent merge; returns its TextEdit, or None if there is nothing to undo."""
+        if not self._undo:
+            return None
+        entry = self._undo.pop()
+        _, i1, i2, j1, j2 = entry.opcode
+        if entry.direction == 'to_right':
+            edit = TextEdit(2, j1, j1 + (i2 - i1), entry.old_text)
+        else:
+            edit = TextEdit(1, i1, i1 + (j2 - j1), entry.old_text)
+        self._replace(edit)
+        self.opcodes.restore(entry.op_idx, entry.opcode)
+        self._redo.append(entry)
+        return edit
+
+    def redo(self):
+        """Re-applies the most recently undone merge; returns its TextEdit, or None."""
+        if not self._redo:
+            return None
+        entry = self._redo.pop()
+        return self._apply(entry.op_idx, entry.direction)
+
+    def _apply(self, op_idx, direction):
+        tag, i1, i2, j1, j2 = self.opcodes[op_idx]
+        if tag == 'equal':
+            return None
+        if direction == 'to_right':
+            edit = TextEdit(2, j1, j2, self.texts[1].slice(i1, i2))
+            old_text = self.texts[2].slice(j1, j2)
+        elif direction == 'to_left':
+            edit = TextEdit(1, i1, i2, self.texts[2].slice(j1, j2))
+            old_text = self.texts[1].slice(i1, i2)
+        else:
+            raise ValueError(f"Unknown merge direction {direction!r}")
+        self._replace(edit)
+        opcode = self.opcodes.apply_merge(op_idx, direction)
+        self._undo.append(MergeEdit(op_idx, direction, opcode, old_text))
+        return edit
+
+    def _replace(self, edit):
+        self.texts[edit.side].replace(edit.start, edit.end, edit.new_text)
+        self._dirty.add(edit.side)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self.widget is None:
+            return
+        if self._flush_id is not None:
+            self.widget.after_cancel(self._flush_id)
+        self._flush_id = self.widget.after(self.flush_delay, self.flush)
+
+    def flush(self):
+        """Writes every side that changed since the last flush."""
+        if self._flush_id is not None:
+            self.widget.after_cancel(self._flush_id)
+            self._flush_id = None
+        for side in sorted(self._dirty):
+            try:
+                write_text_atomic(self.paths[side], self.texts[side], self.encoding)
+            except OSError as e:
+                if self.on_error is None:
+                    raise
+                self.on_error(self.paths[side], e)
+                continue
+            self._dirty.discard(side)
+            if self.on_write:
+                self.on_write(self.paths[side])
+
+    def close(self):
+        """Flushes pending changes; the session should not be used afterwards."""
+        self.flush()
@@ -0,0 +1,138 @@
+import struct
+import sys
+from array import array
+from itertools import chain
+from operator import sub
+
+TAG_CODES = {'equal': 0, 'replace': 1, 'delete': 2, 'insert': 3}
+TAG_NAMES = ('equal', 'replace', 'delete', 'insert')
+
+# Bump when the packed layout changes.
+PACK_FORMAT_VERSION = 2
+_MAGIC = b"DNOP"
+_HEADER = struct.Struct("<4sBqqq")
+
+class OpcodeArray:
+    """
+    A compact sequence of diff opcodes.
+
+    Opcodes are contiguous, so only the end offset of every entry is stored
+    on each side, in array('q') columns next to a bytearray of one-byte tag
+    codes: 17 bytes per opcode instead of a tuple of five objects. Start
+    offsets are the previous entry's ends (or start1/start2 for the first).
+
+    Indexing, iteration and len() behave like a list of (tag, i1, i2, j1, j2)
+    tuples, so code written for get_opcodes() style lists keeps working.
+    """
+
+    __slots__ = ('tags', 'ends1', 'ends2', 'start1', 'start2')
+
+    def __init__(self, tags=None, ends1=None, ends2=None, start1=0, start2=0):
+        self.tags = bytearray() if tags is None else tags
+        self.ends1 = array('q') if ends1 is None else ends1
+        self.ends2 = array('q') if ends2 is None else ends2
+        self.start1 = start1
+        self.start2 = start2
+
+    @classmethod
+    def from_opcodes(cls, opcodes):
+        """Builds an array from (tag, i1, i2, j1, j2) tuples, which must be contiguous."""
+        if isinstance(opcodes, cls):
+            return opcodes[:]
+        result = cls()
+        for tag, i1, i2, j1, j2 in opcodes:
+            if not result.tags:
+                result.start1, result.start2 = i1, j1
+            result.append(tag, i2, j2)
+        return result
+
+    def append(self, tag, i2, j2):
+        """Appends an opcode that starts where the last one ends."""
+        self.tags.append(TAG_CODES[tag])
+        self.ends1.append(i2)
+        self.ends2.append(j2)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.tags))
+            if step != 1:
+                raise ValueError("OpcodeArray slices must be contiguous")
+            stop = max(start, stop)
+            return OpcodeArray(self.tags[start:stop], self.ends1[start:stop], self.ends2[start:stop],
+                               self._start_of(self.ends1, self.start1, start),
+                               self._start_of(self.ends2, self.start2, start))
+        if index < 0:
+            index += len(self.tags)
+        if not 0 <= index < len(self.tags):
+            raise IndexError("opcode index out of range")
+        return (TAG_NAMES[self.tags[index]],
+                self._start_of(self.ends1, self.start1, index), self.ends1[index],
+                self._start_of(self.ends2, self.start2, index), self.ends2[index])
+
+    @staticmethod
+    def _start_of(ends, start, index):
+        return ends[index - 1] if index else start
+
+    def __iter__(self):
+        return zip(map(TAG_NAMES.__getitem__, self.tags),
+                   chain((self.start1,), self.ends1), self.ends1,
+                   chain((self.start2,), self.ends2), self.ends2)
+
+    def __eq__(self, other):
+        if isinstance(other, OpcodeArray):
+            return (self.tags == other.tags and self.ends1 == other.ends1 and self.ends2 == other.ends2
+                    and (self.start1, self.start2) == (other.start1, other.start2))
+        try:
+            return len(self) == len(other) and all(map(tuple.__eq__, self, map(tuple, other)))
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return f"OpcodeArray({list(self)!r})"
+
+    def lengths(self, side=1):
+        """Returns an array('q') with the length of every entry's range on one side."""
+        ends, start = (self.ends1, self.start1) if side == 1 else (self.ends2, self.start2)
+        return array('q', map(sub, ends, chain((start,), ends)))
+
+    def to_bytes(self):
+        """Packs the array into a portable little-endian binary form."""
+        ends1, ends2 = self.ends1, self.ends2
+        if sys.byteorder != "little":
+            ends1, ends2 = array('q', ends1), array('q', ends2)
+            ends1.byteswap()
+            ends2.byteswap()
+        header = _HEADER.pack(_MAGIC, PACK_FORMAT_VERSION, len(self.tags), self.start1, self.start2)
+        return b"".join((header, bytes(self.tags), ends1.tobytes(), ends2.tobytes()))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Unpacks an array produced by to_bytes().
+
+        Raises:
+            ValueError: If the data is not a packed opcode array of this version.
+        """
+        try:
+            magic, version, count, start1, start2 = _HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("Truncated opcode data") from None
+        if magic != _MAGIC or version != PACK_FORMAT_VERSION:
+            raise ValueError("Unsupported opcode data")
+        offset = _HEADER.size
+        tags = bytearray(data[offset:offset + count])
+        offset += count
+        ends1, ends2 = array('q'), array('q')
+        ends1.frombytes(data[offset:offset + 8 * count])
+        ends2.frombytes(data[offset + 8 * count:offset + 16 * count])
+        if len(tags) != count or len(ends1) != count or len(ends2) != count:
+            raise ValueError("Truncated opcode data")
+        if max(tags, default=0) >= len(TAG_NAMES):
+            raise ValueError("Unsupported opcode data")
+        if sys.byteorder != "little":
+            ends1.byteswap()
+            ends2.byteswap()
+        return cls(tags, ends1, ends2, start1, start2)
@@ -0,0 +1,234 @@
+from opcode_array import TAG_CODES, TAG_NAMES, OpcodeArray
+
+class _FenwickTree:
+    """Prefix sums over a list of integers with O(log n) point updates."""
+
+    def __init__(self, values):
+        self._size = len(values)
+        tree = [0] + list(values)
+        for i in range(1, self._size + 1):
+            parent = i + (i & -i)
+            if parent <= self._size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def add(self, index, delta):
+        """Adds delta to the value at index."""
+        i = index + 1
+        tree = self._tree
+        while i <= self._size:
+            tree[i] += delta
+            i += i & -i
+
+    def search(self, value):
+        """Returns the largest index such that prefix_sum(index) <= value."""
+        pos = 0
+        step = 1 << self._size.bit_length()
+        tree = self._tree
+        while step:
+            nxt = pos + step
+            if nxt <= self._size and tree[nxt] <= value:
+                pos = nxt
+                value -= tree[nxt]
+            step >>= 1
+        return pos
+
+    def prefix_sum(self, index):
+        """Returns the sum of the values before index."""
+        total = 0
+        i = index
+        tree = self._tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+class OpcodeModel:
+    """
+    A mutable list of diff opcodes that supports incremental merges.
+
+    Each entry stores a one-byte tag code and the lengths of its ranges on
+    both sides, in compact columns; absolute offsets are derived from
+    Fenwick trees over those lengths. A
+    merge turns one entry into an 'equal' run and updates a single length,
+    so the offsets of every following entry shift in O(log n) instead of
+    being rewritten or recomputed by a full re-diff.
+
+    Entry indices are stable across merges: a merged entry stays in place as
+    an 'equal' run, so indices held by the viewer remain valid.
+    """
+
+    def __init__(self, opcodes=()):
+        if not isinstance(opcodes, OpcodeArray):
+            opcodes = OpcodeArray.from_opcodes(opcodes)
+        self._tags = bytearray(opcodes.tags)
+        self._len1 = opcodes.lengths(1)
+        self._len2 = opcodes.lengths(2)
+        self._build_offsets()
+
+    def _build_offsets(self):
+        self._offsets1 = _FenwickTree(self._len1)
+        self._offsets2 = _FenwickTree(self._len2)
+
+    def __len__(self):
+        return len(self._tags)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._tags)
+        if not 0 <= index < len(self._tags):
+            raise IndexError("opcode index out of range")
+        i1 = self._offsets1.prefix_sum(index)
+        j1 = self._offsets2.prefix_sum(index)
+        return (TAG_NAMES[self._tags[index]], i1, i1 + self._len1[index], j1, j1 + self._len2[index])
+
+    def __iter__(self):
+        i = j = 0
+        for code, len1, len2 in zip(self._tags, self._len1, self._len2):
+            yield (TAG_NAMES[code], i, i + len1, j, j + len2)
+            i += len1
+            j += len2
+
+    def iter_from(self, index):
+        """Yields (index, opcode) pairs starting at the given entry."""
+        i = self._offsets1.prefix_sum(index)
+        j = self._offsets2.prefix_sum(index)
+        for k in range(index, len(self._tags)):
+            len1, len2 = self._len1[k], self._len2[k]
+            yield k, (TAG_NAMES[self._tags[k]], i, i + len1, j, j + len2)
+            i += len1
+            j += len2
+
+    def find(self, offset, side=1):
+        """
+        Returns the index of the entry whose range contains a character offset.
+
+        Args:
+            offset: A character offset into the first or second text.
+            side: 1 to search the first text's ranges, 2 for the second's.
+
+        Returns:
+            The index of the entry containing offset, skipping entries that
+            are empty on that side; len(self) if offset is past the end.
+        """
+        offsets = self._offsets1 if side == 1 else self._offsets2
+        return offsets.search(offset)
+
+    def apply_merge(self, index, direction):
+        """
+        Records that the hunk at index was merged in the given direction.
+
+        Args:
+            index: Index of the opcode that was merged.
+            direction: 'to_right' if the left text replaced the right range,
+                'to_left' if the right text replaced the left range.
+
+        Returns:
+            The opcode tuple as it was before the merge.
+        """
+        opcode = self[index]
+        len1, len2 = self._len1[index], self._len2[index]
+        if direction == 'to_right':
+            self._len2[index] = len1
+            self._offsets2.add(index, len1 - len2)
+        elif direction == 'to_left':
+            self._len1[index] = len2
+            self._offsets1.add(index, len2 - len1)
+        else:
+            raise ValueError(f"Unknown merge direction {direction!r}")
+        self._tags[index] = TAG_CODES['equal']
+        return opcode
+
+    def restore(self, index, opcode):
+        """
+        Puts back an entry as returned by apply_merge(), undoing that merge.
+
+        The entry must still start at the offsets recorded in opcode, which
+        holds as long as merges are undone in reverse order.
+        """
+        tag, i1, i2, j1, j2 = opcode
+        len1, len2 = i2 - i1, j2 - j1
+        self._offsets1.add(index, len1 - self._len1[index])
+        self._offsets2.add(index, len2 - self._len2[index])
+        self._len1[index] = len1
+        self._len2[index] = len2
+        self._tags[index] = TAG_CODES[tag]
+
+    def splice(self, start, stop, opcodes):
+        """
+        Replaces the entries start..stop with a new run of opcodes.
+
+        The new opcodes must cover the same character ranges on both sides as
+        the entries they replace (after any edit of the texts themselves),
+        with offsets relative to the start of those ranges. This rebuilds the
+        offset index, so it is meant for re-diffing a neighbourhood, not for
+        every merge.
+        """
+        opcodes = OpcodeArray.from_opcodes(opcodes)
+        self._tags[start:stop] = opcodes.tags
+        self._len1[start:stop] = opcodes.lengths(1)
+        self._len2[start:stop] = opcodes.lengths(2)
+        self._build_offsets()
+
+    def mark_edit(self, side, start, end, new_text_length):
+        """
+        Updates the opcodes after text[start:end] of one side was replaced by new text, without diffing it.
+
+        The entries overlapping start..end become a single hunk covering the
+        changed region. Where the edit begins or ends inside an 'equal'
+        entry, the untouched part of that entry is kept as it is, so an edit
+        in the middle of a long unchanged run leaves a hunk of the edit
+        alone. Diffing the two ranges the hunk covers and splice()ing the
+        result over it refines it.
+
+        Args:
+            side: 1 or 2, the text that was edited.
+            start: Start of the replaced range, in the text before the edit.
+            end: End of the replaced range, in the text before the edit.
+            new_text_length: Length of the text that replaced it.
+
+        Returns:
+            (index, ranges): the index of the new hunk, or None if the
+            changed region is empty on both sides, and the (lo1, hi1, lo2,
+            hi2) character ranges of the texts after the edit that it covers.
+        """
+        count = len(self)
+        if not count:
+            # Both texts were empty, so the new text is the whole region.
+            first, last, head, tail = 0, -1, 0, 0
+            lo1 = lo2 = 0
+            hi1, hi2 = (new_text_length, 0) if side == 1 else (0, new_text_length)
+        else:
+            first = min(self.find(start, side), count - 1)
+            last = min(self.find(max(start, end - 1), side), count - 1)
+            tag, i1, _, j1, _ = self[first]
+            last_tag, _, i2, _, j2 = self[last]
+
+            # Equal text before and after the edit inside the boundary entries is kept.
+            head = start - (i1 if side == 1 else j1) if tag == 'equal' else 0
+            tail = (i2 if side == 1 else j2) - end if last_tag == 'equal' else 0
+            head, tail = max(head, 0), max(tail, 0)
+            delta = new_text_length - (end - start)
+            if side == 1:
+                lo1, hi1, lo2, hi2 = i1 + head, i2 - tail + delta, j1 + head, j2 - tail
+            else:
+                lo1, hi1, lo2, hi2 = i1 + head, i2 - tail, j1 + head, j2 - tail + delta
+
+        opcodes = []
+        if head:
+            opcodes.append(('equal', 0, head, 0, head))
+        index = first + len(opcodes)
+        len1, len2 = hi1 - lo1, hi2 - lo2
+        if len1 or len2:
+            tag = 'replace' if len1 and len2 else 'delete' if len1 else 'insert'
+            opcodes.append((tag, head, head + len1, head, head + len2))
+        else:
+            index = None
+        if tail:
+            opcodes.append(('equal', head + len1, head + len1 + tail, head + len2, head + len2 + tail))
+        self.splice(first, last + 1, opcodes)
+        return index, (lo1, hi1, lo2, hi2)
+
+    def to_array(self):
+        """Returns the current opcodes as an OpcodeArray."""
+        return OpcodeArray.from_opcodes(self)
@@ -0,0 +1,167 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Set to enable tracing from startup; it can also be toggled from the Tools menu.
+TRACE_ENV = "DIFFNOTE_TRACE"
+# Timed events kept for the Chrome trace export; older ones are dropped.
+MAX_EVENTS = 100_000
+
+_enabled = bool(os.environ.get(TRACE_ENV))
+_lock = threading.Lock()
+_origin = time.perf_counter()
+_events = deque(maxlen=MAX_EVENTS)
+# name -> [calls, total seconds, longest call in seconds]
+_timings = {}
+# name -> running total
+_counters = {}
+
+def enabled():
+    return _enabled
+
+def enable(on=True):
+    """Turns tracing on or off; collected data is kept until reset()."""
+    global _enabled
+    _enabled = on
+
+def reset():
+    """Forgets every collected event, timing and counter."""
+    with _lock:
+        _events.clear()
+        _timings.clear()
+        _counters.clear()
+
+def record(name, start, duration, category="app"):
+    """
+    Records a timed event that has already finished.
+
+    Args:
+        name: Event name, e.g. "diff_viewer.display_diff".
+        start: time.perf_counter() value at which it began.
+        duration: Its length in seconds.
+        category: Chrome trace category, used to group and filter events.
+    """
+    with _lock:
+        _events.append(("X", name, category, start, duration, threading.get_ident()))
+        timing = _timings.get(name)
+        if timing is None:
+            _timings[name] = [1, duration, duration]
+        else:
+            timing[0] += 1
+            timing[1] += duration
+            if duration > timing[2]:
+                timing[2] = duration
+
+def count(name, n=1):
+    """Adds n to a counter, e.g. the number of tags applied by a render; a no-op while tracing is off."""
+    if not _enabled:
+        return
+    with _lock:
+        total = _counters.get(name, 0) + n
+        _counters[name] = total
+        _events.append(("C", name, "counter", time.perf_counter(), total, threading.get_ident()))
+
+class _Span:
+    __slots__ = ('name', 'category', 'start')
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, self.start, time.perf_counter() - self.start, self.category)
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def span(name, category="app"):
+    """Returns a context manager that times its block; while tracing is off it is a shared no-op."""
+    return _Span(name, category) if _enabled else _NULL_SPAN
+
+def traced(name=None, category="app"):
+    """
+    Decorator that times every call of a function while tracing is on.
+
+    While tracing is off the wrapper only checks a flag before calling
+    through. Calls made in a worker process are not seen by the app's
+    trace; time those from the caller's side with record() instead.
+    """
+    def decorate(function):
+        event_name = name or f"{function.__module__}.{function.__qualname__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(event_name, start, time.perf_counter() - start, category)
+        return wrapper
+    return decorate
+
+def stats():
+    """
+    Summarizes what was collected.
+
+    Returns:
+        A (timings, counters) pair: timings maps each event name to a dict
+        with "calls", "total", "mean" and "max" in seconds, counters maps
+        each counter name to its total.
+    """
+    with _lock:
+        timings = {name: {"calls": calls, "total": total, "mean": total / calls, "max": longest}
+                   for name, (calls, total, longest) in _timings.items()}
+        return timings, dict(_counters)
+
+def format_stats():
+    """Renders stats() as a plain-text table, slowest total first."""
+    timings, counters = stats()
+    lines = [f"{'event':44} {'calls':>8} {'total ms':>11} {'mean ms':>10} {'max ms':>10}"]
+    for name, timing in sorted(timings.items(), key=lambda item: -item[1]["total"]):
+        lines.append(f"{name:44} {timing['calls']:8} {timing['total'] * 1000:11.2f} "
+                     f"{timing['mean'] * 1000:10.3f} {timing['max'] * 1000:10.3f}")
+    if counters:
+        lines.append("")
+        lines.append(f"{'counter':44} {'total':>8}")
+        for name, total in sorted(counters.items()):
+            lines.append(f"{name:44} {total:8}")
+    return "\n".join(lines)
+
+def export_chrome_trace(path):
+    """
+    Writes the collected events in the Chrome trace event format.
+
+    The file opens in chrome://tracing or https://ui.perfetto.dev. Timed
+    events become complete ("X") events and counters become counter ("C")
+    events, with timestamps in microseconds since the module was loaded.
+    """
+    pid = os.getpid()
+    with _lock:
+        events = list(_events)
+    trace_events = []
+    for phase, name, category, start, value, thread in events:
+        event = {"name": name, "cat": category, "ph": phase, "ts": (start - _origin) * 1e6, "pid": pid, "tid": thread}
+        if phase == "X":
+            event["dur"] = value * 1e6
+        else:
+            event["args"] = {"value": value}
+        trace_events.append(event)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
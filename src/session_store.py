@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+
+from file_utils import write_text_atomic
+
+SESSION_FILE_NAME = "session.json"
+SESSION_VERSION = 1
+
+def user_config_dir(app_name="DiffNote"):
+    """Returns the per-user configuration directory for the application, following platform conventions."""
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~\\AppData\\Roaming")
+        return os.path.join(base, app_name)
+    if sys.platform == "darwin":
+        return os.path.join(os.path.expanduser("~/Library/Application Support"), app_name)
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, app_name.lower())
+
+def default_session_path():
+    return os.path.join(user_config_dir(), SESSION_FILE_NAME)
+
+def load_session(path=None):
+    """
+    Reads the saved editor session.
+
+    Returns:
+        A dict with a "tabs" list of {"path", "cursor", "top_line"} entries
+        and the "active" tab path (or None). A missing or unreadable file
+        gives an empty session.
+    """
+    try:
+        with open(path or default_session_path(), encoding="utf-8") as f:
+            session = json.load(f)
+        if session.get("version") != SESSION_VERSION:
+            raise ValueError("Unsupported session version")
+        tabs = [tab for tab in session.get("tabs", []) if isinstance(tab, dict) and tab.get("path")]
+        return {"tabs": tabs, "active": session.get("active")}
+    except (OSError, ValueError, AttributeError):
+        return {"tabs": [], "active": None}
+
+def save_session(tabs, active=None, path=None):
+    """
+    Writes the editor session atomically.
+
+    Args:
+        tabs: List of {"path", "cursor", "top_line"} dicts, in tab order.
+        active: Path of the active tab, if it is one of tabs.
+        path: Session file; defaults to session.json in the config directory.
+    """
+    path = path or default_session_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_text_atomic(path, json.dumps({"version": SESSION_VERSION, "tabs": tabs, "active": active}, indent=2))
@@ -0,0 +1,237 @@
+import random
+
+# Upper bound on the text stored in one node. Edits copy at most one node's
+# text, so this bounds the per-edit copying independently of the file size.
+LEAF_CHARS = 4096
+
+class _Node:
+    """A treap node holding one piece of the text, with subtree totals."""
+
+    __slots__ = ('piece', 'piece_newlines', 'left', 'right', 'priority', 'length', 'newlines')
+
+    def __init__(self, piece, left=None, right=None, priority=None, piece_newlines=None):
+        self.piece = piece
+        self.piece_newlines = piece.count('\n') if piece_newlines is None else piece_newlines
+        self.left = left
+        self.right = right
+        self.priority = random.random() if priority is None else priority
+        self.update()
+
+    def update(self):
+        left, right = self.left, self.right
+        self.length = len(self.piece) + (left.length if left else 0) + (right.length if right else 0)
+        self.newlines = self.piece_newlines + (left.newlines if left else 0) + (right.newlines if right else 0)
+
+    def with_children(self, left, right):
+        """Returns a copy of this node with other children."""
+        return _Node(self.piece, left, right, self.priority, self.piece_newlines)
+
+def _length(node):
+    return node.length if node else 0
+
+def _build(text):
+    """Builds a treap from a string in O(n), cutting it into LEAF_CHARS pieces."""
+    root_stack = []
+    for start in range(0, len(text), LEAF_CHARS):
+        node = _Node(text[start:start + LEAF_CHARS])
+        last = None
+        while root_stack and root_stack[-1].priority < node.priority:
+            last = root_stack.pop()
+        node.left = last
+        if root_stack:
+            root_stack[-1].right = node
+        root_stack.append(node)
+    if not root_stack:
+        return None
+    # Children were attached after construction, so fix the totals bottom-up.
+    order = []
+    pending = [root_stack[0]]
+    while pending:
+        node = pending.pop()
+        order.append(node)
+        pending.extend(child for child in (node.left, node.right) if child)
+    for node in reversed(order):
+        node.update()
+    return root_stack[0]
+
+def _merge(a, b):
+    """Concatenates two treaps, creating new nodes along the seam only."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.priority > b.priority:
+        return a.with_children(a.left, _merge(a.right, b))
+    return b.with_children(_merge(a, b.left), b.right)
+
+def _split(node, pos):
+    """Splits a treap at a character offset into two new treaps, copying only the path to pos."""
+    if node is None:
+        return None, None
+    left_length = _length(node.left)
+    if pos <= left_length:
+        left, right = _split(node.left, pos)
+        return left, node.with_children(right, node.right)
+    pos -= left_length
+    piece_length = len(node.piece)
+    if pos >= piece_length:
+        left, right = _split(node.right, pos - piece_length)
+        return node.with_children(node.left, left), right
+    # The offset falls inside this piece: it becomes two nodes. Both may keep
+    # the node's priority, which is at least that of their children.
+    return (_Node(node.piece[:pos], node.left, None, node.priority),
+            _Node(node.piece[pos:], None, node.right, node.priority))
+
+def _replace_in_piece(node, start, end, text):
+    """
+    Replaces start..end inside a single piece by copying that piece.
+
+    Returns the new root, or None if the range spans several pieces or the
+    piece would grow beyond LEAF_CHARS.
+    """
+    if node is None:
+        return None
+    left_length = _length(node.left)
+    piece_length = len(node.piece)
+    if end <= left_length and start < left_length:
+        left = _replace_in_piece(node.left, start, end, text)
+        return left and node.with_children(left, node.right)
+    if start > left_length + piece_length or (start == left_length + piece_length and end > start):
+        right = _replace_in_piece(node.right, start - left_length - piece_length,
+                                  end - left_length - piece_length, text)
+        return right and node.with_children(node.left, right)
+    start -= left_length
+    end -= left_length
+    if start < 0 or end > piece_length or piece_length - (end - start) + len(text) > LEAF_CHARS:
+        return None
+    return _Node(node.piece[:start] + text + node.piece[end:], node.left, node.right, node.priority)
+
+def _collect(node, start, end, out):
+    """Appends the pieces covering start..end (relative to node) to out."""
+    while node is not None and start < end:
+        left_length = _length(node.left)
+        if start < left_length:
+            _collect(node.left, start, min(end, left_length), out)
+        piece_start, piece_end = left_length, left_length + len(node.piece)
+        if start < piece_end and end > piece_start:
+            out.append(node.piece[max(start, piece_start) - piece_start:min(end, piece_end) - piece_start])
+        start = max(start - piece_end, 0)
+        end -= piece_end
+        node = node.right
+
+class TextBuffer:
+    """
+    A persistent rope for editing large texts.
+
+    The text is kept in a treap of pieces of at most LEAF_CHARS characters,
+    ordered by position and annotated with subtree lengths and newline
+    counts. Insert, delete, slice and line lookups take O(log n) time plus
+    the size of the pieces involved, instead of copying the whole string.
+
+    Nodes are never modified once built, so snapshot() is O(1): a snapshot
+    keeps seeing the text as it was, even while this buffer is edited, and
+    can be read from another thread.
+    """
+
+    def __init__(self, text="", _root=None):
+        self._root = _root if _root is not None or not text else _build(text)
+
+    def __len__(self):
+        return _length(self._root)
+
+    def __str__(self):
+        return "".join(self.chunks())
+
+    def __repr__(self):
+        return f"TextBuffer(<{len(self)} characters>)"
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("TextBuffer slices must be contiguous")
+            return self.slice(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("text index out of range")
+        return self.slice(index, index + 1)
+
+    def snapshot(self):
+        """Returns an unchanging view of the current text; it shares all storage with this buffer."""
+        return TextBuffer(_root=self._root)
+
+    def same_version(self, other):
+        """True if other holds this exact version of the text, e.g. an unedited snapshot of it; O(1)."""
+        return self._root is other._root
+
+    def slice(self, start, end):
+        """Returns the text between two character offsets."""
+        return "".join(self.chunks(start, end))
+
+    def chunks(self, start=0, end=None):
+        """Returns the pieces covering start..end in order, without joining them."""
+        length = len(self)
+        end = length if end is None else min(end, length)
+        out = []
+        if start < end:
+            _collect(self._root, max(start, 0), end, out)
+        return out
+
+    def insert(self, pos, text):
+        """Inserts text at a character offset."""
+        self.replace(pos, pos, text)
+
+    def delete(self, start, end):
+        """Deletes the text between two character offsets."""
+        self.replace(start, end, "")
+
+    def replace(self, start, end, text):
+        """Replaces the text between two character offsets."""
+        length = len(self)
+        start = min(max(start, 0), length)
+        end = min(max(end, start), length)
+        if start == end and not text:
+            return
+        root = _replace_in_piece(self._root, start, end, text) if len(text) <= LEAF_CHARS else None
+        if root is None:
+            left, rest = _split(self._root, start)
+            _, right = _split(rest, end - start)
+            root = _merge(_merge(left, _build(text)), right)
+        self._root = root
+
+    @property
+    def line_count(self):
+        """Number of lines, counting the (possibly empty) line after a trailing newline."""
+        return (self._root.newlines if self._root else 0) + 1
+
+    def line_start(self, line):
+        """Returns the character offset at which a 0-based line starts, or len(self) past the last line."""
+        if line <= 0:
+            return 0
+        node = self._root
+        offset = 0
+        while node is not None:
+            left_newlines = node.left.newlines if node.left else 0
+            if line <= left_newlines:
+                node = node.left
+                continue
+            line -= left_newlines
+            offset += _length(node.left)
+            piece_newlines = node.piece_newlines
+            if line <= piece_newlines:
+                position = -1
+                for _ in range(line):
+                    position = node.piece.index('\n', position + 1)
+                return offset + position + 1
+            line -= piece_newlines
+            offset += len(node.piece)
+            node = node.right
+        return offset
+
+    def offset(self, line, column):
+        """Converts a 0-based line and column into a character offset, clamped to the text."""
+        start = self.line_start(line)
+        if line >= self.line_count:
+            return start
+        return min(start + column, self.line_start(line + 1) - 1 if line + 1 < self.line_count else len(self))
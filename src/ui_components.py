@@ -1,5 +1,19 @@
 import customtkinter as ctk
 import tkinter as tk
+import perf_trace
+from text_buffer import TextBuffer
+
+# Minimum delay between line number redraws (about one frame at 60 Hz).
+LINE_NUMBER_FRAME_MS = 16
+# How often the performance stats window refreshes itself.
+STATS_REFRESH_MS = 1000
+
+def text_area(textbox):
+    """Returns the Tk text widget a CTkTextbox draws its text in, which dlineinfo() coordinates refer to."""
+    for child in textbox.winfo_children():
+        if isinstance(child, tk.Text):
+            return child
+    return textbox
 
 class TextEditorWithLineNumbers(ctk.CTkFrame):
     def __init__(self, master, **kwargs):
@@ -21,69 +35,152 @@ class TextEditorWithLineNumbers(ctk.CTkFrame):
         self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scroll)
         self.scrollbar.grid(row=0, column=2, sticky='ns')
 
-        # Connect only textbox to the scrollbar
-        self.textbox.configure(yscrollcommand=self.scrollbar.set)
+        # Connect only textbox to the scrollbar; every view change also refreshes the line numbers
+        self.textbox.configure(yscrollcommand=self._on_yscroll)
         # Do not connect line_numbers to scrollbar as we want it to stay fixed
 
+        # Line number redraws are coalesced to one per frame, and the canvas
+        # text items are kept in a pool and updated in place.
+        self._line_number_items = []
+        self._line_numbers_pending = None
+        self._line_numbers_state = None
+
         # Event bindings
         self.textbox.bind("<<Modified>>", self._on_text_modified, add=True)
         self.textbox.bind("<MouseWheel>", self._on_mouse_wheel, add=True)
         self.line_numbers.bind("<MouseWheel>", self._on_mouse_wheel, add=True)
-
-        self.after(100, self._update_line_numbers)
+        self.line_numbers.bind("<Configure>", lambda event: self._schedule_line_numbers(), add=True)
+
+        # A rope mirrors the widget's contents so the tab memory budget and
+        # unsaved-change tracking can use its length and O(1) snapshots
+        # without asking Tk to copy the text. Saves read the widget itself.
+        self.buffer = TextBuffer()
+        self._install_edit_proxy()
+
+        self.after(100, self._schedule_line_numbers)
+
+    def _install_edit_proxy(self):
+        """Routes every insert and delete of the Tk text widget through _dispatch_edit, keyboard edits included."""
+        widget = text_area(self.textbox)
+        self._widget_command = str(widget)
+        self._original_command = self._widget_command + "_original"
+        widget.tk.call("rename", self._widget_command, self._original_command)
+        widget.tk.createcommand(self._widget_command, self._dispatch_edit)
+        widget.bind("<Destroy>", lambda event: widget.tk.deletecommand(self._widget_command), add=True)
+
+    def _call_original(self, *args):
+        return self.tk.call((self._original_command,) + args)
+
+    def _offset(self, index):
+        line, column = self._call_original("index", index).split(".")
+        return self.buffer.offset(int(line) - 1, int(column))
+
+    def _dispatch_edit(self, operation, *args):
+        edit = None
+        resync = False
+        if operation in ("insert", "delete", "replace") and self._call_original("cget", "-state") != "disabled":
+            if operation == "insert" and args:
+                offset = self._offset(args[0])
+                edit = (offset, offset, "".join(args[1::2]))
+            elif operation == "delete" and 1 <= len(args) <= 2:
+                start = self._offset(args[0])
+                edit = (start, self._offset(args[1]) if len(args) == 2 else start + 1, "")
+            else:
+                resync = True
+        elif operation == "edit" and args and args[0] in ("undo", "redo"):
+            resync = True
+
+        result = self._call_original(operation, *args)
+        if edit:
+            self.buffer.replace(*edit)
+        elif resync:
+            # Rare forms (multi-range deletes, replace, undo) are mirrored by re-reading the widget.
+            self.buffer = TextBuffer(self._call_original("get", "1.0", "end-1c"))
+        return result
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_line_numbers()
 
     def _on_scroll(self, *args):
         """Scroll only the textbox, then update line numbers."""
         self.textbox.yview(*args)
-        self.after(10, self._update_line_numbers)
+        self._schedule_line_numbers()
 
     def _on_mouse_wheel(self, event):
         """Proxy mouse wheel events to the scrollbar for textbox only."""
-        self.scrollbar.set(self.textbox.yview()[0], self.textbox.yview()[1])
         if event.delta > 0:
             self.textbox.yview_scroll(-1, "units")
         else:
             self.textbox.yview_scroll(1, "units")
-        self._update_line_numbers()
+        self._schedule_line_numbers()
         return "break" # Prevents the event from propagating further
 
     def _on_text_modified(self, event=None):
-        self.after(10, self._update_line_numbers)
+        self._schedule_line_numbers()
         self.textbox.edit_modified(False)
 
+    def _schedule_line_numbers(self):
+        """Requests a line number redraw; bursts of requests collapse into one per frame."""
+        if self._line_numbers_pending is None:
+            self._line_numbers_pending = self.after(LINE_NUMBER_FRAME_MS, self._update_line_numbers)
+
+    @perf_trace.traced("ui_components.update_line_numbers", "render")
     def _update_line_numbers(self):
-        self.line_numbers.delete("all")
+        self._line_numbers_pending = None
 
         try:
             # Get the total number of lines in the text
             total_lines = int(self.textbox.index('end-1c').split('.')[0])
             if total_lines < 1: return
-            
+
             # Get the first visible line
             first_visible = self.textbox.index('@0,0')
             first_line_num = int(first_visible.split('.')[0])
-            
+
+            # Nothing to redraw if the view shows the same lines at the same place
+            first_dline = self.textbox.dlineinfo(first_visible)
+            height = self.textbox.winfo_height()
+            state = (first_line_num, total_lines, first_dline[1] if first_dline else None, height)
+            if state == self._line_numbers_state:
+                return
+            self._line_numbers_state = state
+
             # Get the last visible line
-            last_visible = self.textbox.index(f'@0,{self.textbox.winfo_height()}')
+            last_visible = self.textbox.index(f'@0,{height}')
             last_line_num = int(last_visible.split('.')[0])
-            
+
             # Create a font object for line numbers
             line_font = self.textbox.cget('font')
-            
-            # Draw line numbers for all visible lines
+
+            # Draw line numbers for all visible lines, reusing pooled items
+            used = 0
             for line_num in range(first_line_num, min(last_line_num + 2, total_lines + 1)):
                 # Get the y-coordinate of the line
                 dline = self.textbox.dlineinfo(f"{line_num}.0")
                 if not dline: continue
-                
-                # Draw the line number
-                self.line_numbers.create_text(
-                    30, dline[1], 
-                    anchor='e', 
-                    text=str(line_num), 
-                    fill='#6A6A6A', 
-                    font=line_font
-                )
+
+                if used < len(self._line_number_items):
+                    item = self._line_number_items[used]
+                    self.line_numbers.coords(item, 30, dline[1])
+                    self.line_numbers.itemconfigure(item, text=str(line_num), state='normal')
+                else:
+                    # Draw the line number
+                    item = self.line_numbers.create_text(
+                        30, dline[1],
+                        anchor='e',
+                        text=str(line_num),
+                        fill='#6A6A6A',
+                        font=line_font
+                    )
+                    self._line_number_items.append(item)
+                used += 1
+
+            perf_trace.count("ui_components.line_numbers_drawn", used)
+
+            # Hide pooled items that are not needed for this view
+            for item in self._line_number_items[used:]:
+                self.line_numbers.itemconfigure(item, state='hidden')
         except (tk.TclError, ValueError):
             # Can happen if the widget is not ready or text is empty
             pass
@@ -97,3 +194,61 @@ class TextEditorWithLineNumbers(ctk.CTkFrame):
 
     def get(self, *args, **kwargs):
         return self.textbox.get(*args, **kwargs)
+
+    def widget_text(self):
+        """
+        Returns the whole text as Tk holds it, for saving, and rebuilds the buffer from it.
+
+        Saves write this rather than the buffer, so an edit the proxy
+        mirrored wrongly can never reach the file, and a snapshot taken
+        right after it matches what was written.
+        """
+        text = self.textbox.get("1.0", "end-1c")
+        self.buffer = TextBuffer(text)
+        return text
+
+    def snapshot(self):
+        """Returns an unchanging TextBuffer view of the current text; see TextBuffer.snapshot()."""
+        return self.buffer.snapshot()
+
+class PerfStatsWindow(ctk.CTkToplevel):
+    """A window showing the timings and counters collected by perf_trace, refreshed while it is open."""
+
+    def __init__(self, master, on_export=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.title("Performance")
+        self.geometry("760x420")
+
+        buttons = ctk.CTkFrame(self, fg_color="transparent")
+        buttons.pack(side="bottom", fill="x", padx=5, pady=5)
+        ctk.CTkButton(buttons, text="Reset", width=80, command=self._reset).pack(side="left", padx=5)
+        if on_export:
+            ctk.CTkButton(buttons, text="Export Trace...", width=120, command=on_export).pack(side="left", padx=5)
+
+        self.textbox = ctk.CTkTextbox(self, wrap='none', font=ctk.CTkFont(family="Courier", size=12))
+        self.textbox.pack(fill="both", expand=True, padx=5, pady=(5, 0))
+        self._refresh_id = None
+        self.refresh()
+
+    def refresh(self):
+        self._refresh_id = None
+        text = perf_trace.format_stats()
+        if not perf_trace.enabled():
+            text = "Tracing is off; turn it on under Tools > Trace Performance.\n\n" + text
+        self.textbox.configure(state="normal")
+        self.textbox.delete("1.0", "end")
+        self.textbox.insert("1.0", text)
+        self.textbox.configure(state="disabled")
+        self._refresh_id = self.after(STATS_REFRESH_MS, self.refresh)
+
+    def _reset(self):
+        perf_trace.reset()
+        if self._refresh_id is not None:
+            self.after_cancel(self._refresh_id)
+        self.refresh()
+
+    def destroy(self):
+        if self._refresh_id is not None:
+            self.after_cancel(self._refresh_id)
+            self._refresh_id = None
+        super().destroy()